@@ -0,0 +1,48 @@
+"""Create jobs table
+
+Revision ID: 1c5e2b7d9a40
+Revises: 6f989a43254e
+Create Date: 2026-10-18 09:12:31.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1c5e2b7d9a40"
+down_revision: Union[str, Sequence[str], None] = "6f989a43254e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column(
+            "scene_id",
+            sa.Integer,
+            sa.ForeignKey("scenes.id"),
+            index=True,
+            nullable=False,
+        ),
+        sa.Column("status", sa.Text, nullable=False),
+        sa.Column("attempts", sa.Integer, nullable=False),
+        sa.Column("worker", sa.Text),
+        sa.Column("error", sa.Text),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+        sa.Column("claimed_at", sa.DateTime),
+        sa.Column("finished_at", sa.DateTime),
+    )
+    op.create_index("ix_jobs_status_id", "jobs", ["status", "id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_jobs_status_id", table_name="jobs")
+    op.drop_table("jobs")
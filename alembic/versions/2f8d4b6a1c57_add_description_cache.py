@@ -0,0 +1,50 @@
+"""Add description cache
+
+Revision ID: 2f8d4b6a1c57
+Revises: 9e6a3c5d1b28
+Create Date: 2026-10-18 13:02:41.208317
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "2f8d4b6a1c57"
+down_revision: Union[str, Sequence[str], None] = "9e6a3c5d1b28"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("scenes", sa.Column("phash", sa.Text))
+    op.create_table(
+        "descriptions",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("phash", sa.Text, nullable=False),
+        sa.Column("description", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+    )
+    op.create_table(
+        "description_bands",
+        sa.Column("band", sa.Integer, primary_key=True),
+        sa.Column("value", sa.Integer, primary_key=True),
+        sa.Column(
+            "description_id",
+            sa.Integer,
+            sa.ForeignKey("descriptions.id"),
+            primary_key=True,
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("description_bands")
+    op.drop_table("descriptions")
+    op.drop_column("scenes", "phash")
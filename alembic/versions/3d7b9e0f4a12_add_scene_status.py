@@ -0,0 +1,61 @@
+"""Add scene status
+
+Revision ID: 3d7b9e0f4a12
+Revises: 8a4f1d2c6e73
+Create Date: 2026-10-18 11:41:52.207961
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3d7b9e0f4a12"
+down_revision: Union[str, Sequence[str], None] = "8a4f1d2c6e73"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "scenes",
+        sa.Column("status", sa.Text, nullable=False, server_default="pending"),
+    )
+    op.add_column("scenes", sa.Column("error", sa.Text))
+    op.add_column("scenes", sa.Column("described_at", sa.DateTime))
+    op.add_column("scenes", sa.Column("prompted_at", sa.DateTime))
+    op.add_column("scenes", sa.Column("edited_at", sa.DateTime))
+    op.add_column("scenes", sa.Column("failed_at", sa.DateTime))
+
+    # backfill from the columns filled in by the pipeline so far
+    op.execute("UPDATE scenes SET status = 'described' WHERE description IS NOT NULL")
+    op.execute("UPDATE scenes SET status = 'prompted' WHERE edit_prompt IS NOT NULL")
+    op.execute("UPDATE scenes SET status = 'edited' WHERE result IS NOT NULL")
+    # without a job to finish them, unfinished scenes are failed ones: the
+    # code so far didn't record failures, and they must not all be resumed
+    # by the first sweep
+    op.execute(
+        "UPDATE scenes SET status = 'failed', failed_at = modified_at, "
+        "error = COALESCE((SELECT error FROM jobs WHERE jobs.scene_id = scenes.id "
+        "ORDER BY jobs.id DESC LIMIT 1), 'unfinished before status tracking') "
+        "WHERE result IS NULL AND id NOT IN (SELECT scene_id FROM jobs "
+        "WHERE status IN ('pending', 'running'))"
+    )
+
+    op.create_index(
+        "ix_scenes_status_modified_at_id", "scenes", ["status", "modified_at", "id"]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_scenes_status_modified_at_id", table_name="scenes")
+    op.drop_column("scenes", "failed_at")
+    op.drop_column("scenes", "edited_at")
+    op.drop_column("scenes", "prompted_at")
+    op.drop_column("scenes", "described_at")
+    op.drop_column("scenes", "error")
+    op.drop_column("scenes", "status")
@@ -0,0 +1,33 @@
+"""Add job heartbeat and backoff
+
+Revision ID: 4e8c2a6f1b93
+Revises: 7c3e5a9b2d64
+Create Date: 2026-10-18 16:05:42.861307
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4e8c2a6f1b93"
+down_revision: Union[str, Sequence[str], None] = "7c3e5a9b2d64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("jobs", sa.Column("heartbeat_at", sa.DateTime))
+    op.add_column("jobs", sa.Column("not_before", sa.DateTime))
+    # running jobs claimed before heartbeats existed expire as they used to
+    op.execute("UPDATE jobs SET heartbeat_at = claimed_at WHERE status = 'running'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("jobs", "not_before")
+    op.drop_column("jobs", "heartbeat_at")
@@ -0,0 +1,29 @@
+"""Add scene source data
+
+Revision ID: 5b2c8f1e7d90
+Revises: 3d7b9e0f4a12
+Create Date: 2026-10-18 12:06:40.881377
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b2c8f1e7d90"
+down_revision: Union[str, Sequence[str], None] = "3d7b9e0f4a12"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("scenes", sa.Column("source_data", sa.Text))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("scenes", "source_data")
@@ -0,0 +1,29 @@
+"""Add job trace context
+
+Revision ID: 7c3e5a9b2d64
+Revises: 2f8d4b6a1c57
+Create Date: 2026-10-18 14:21:07.530918
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7c3e5a9b2d64"
+down_revision: Union[str, Sequence[str], None] = "2f8d4b6a1c57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("jobs", sa.Column("trace_context", sa.Text))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("jobs", "trace_context")
@@ -0,0 +1,29 @@
+"""Add scenes modified_at index
+
+Revision ID: 8a4f1d2c6e73
+Revises: 1c5e2b7d9a40
+Create Date: 2026-10-18 11:02:14.530812
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8a4f1d2c6e73"
+down_revision: Union[str, Sequence[str], None] = "1c5e2b7d9a40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_scenes_modified_at_id", "scenes", ["modified_at", "id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_scenes_modified_at_id", table_name="scenes")
@@ -0,0 +1,31 @@
+"""Add scene content hash
+
+Revision ID: 9e6a3c5d1b28
+Revises: 5b2c8f1e7d90
+Create Date: 2026-10-18 12:37:09.412650
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9e6a3c5d1b28"
+down_revision: Union[str, Sequence[str], None] = "5b2c8f1e7d90"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("scenes", sa.Column("content_hash", sa.Text))
+    op.create_index("ix_scenes_content_hash", "scenes", ["content_hash"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_scenes_content_hash", table_name="scenes")
+    op.drop_column("scenes", "content_hash")
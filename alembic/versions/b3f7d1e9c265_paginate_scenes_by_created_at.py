@@ -0,0 +1,38 @@
+"""Paginate scenes by created_at
+
+Revision ID: b3f7d1e9c265
+Revises: 4e8c2a6f1b93
+Create Date: 2026-10-18 16:48:19.204736
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b3f7d1e9c265"
+down_revision: Union[str, Sequence[str], None] = "4e8c2a6f1b93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_scenes_created_at_id", "scenes", ["created_at", "id"])
+    op.create_index(
+        "ix_scenes_status_created_at_id", "scenes", ["status", "created_at", "id"]
+    )
+    # ix_scenes_modified_at_id stays, scene changes are still polled by it
+    op.drop_index("ix_scenes_status_modified_at_id", table_name="scenes")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(
+        "ix_scenes_status_modified_at_id", "scenes", ["status", "modified_at", "id"]
+    )
+    op.drop_index("ix_scenes_status_created_at_id", table_name="scenes")
+    op.drop_index("ix_scenes_created_at_id", table_name="scenes")
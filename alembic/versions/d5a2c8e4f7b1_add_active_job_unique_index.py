@@ -0,0 +1,44 @@
+"""Add active job unique index
+
+Revision ID: d5a2c8e4f7b1
+Revises: b3f7d1e9c265
+Create Date: 2026-10-18 17:20:33.681945
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d5a2c8e4f7b1"
+down_revision: Union[str, Sequence[str], None] = "b3f7d1e9c265"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = "status IN ('pending', 'running')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # jobs queued twice for a scene by concurrent sweeps, keeping the oldest
+    op.execute(
+        "UPDATE jobs SET status = 'failed', error = 'duplicate job' "
+        f"WHERE {ACTIVE} AND id NOT IN "
+        f"(SELECT MIN(id) FROM jobs WHERE {ACTIVE} GROUP BY scene_id)"
+    )
+    op.create_index(
+        "uq_jobs_active_scene_id",
+        "jobs",
+        ["scene_id"],
+        unique=True,
+        postgresql_where=sa.text(ACTIVE),
+        sqlite_where=sa.text(ACTIVE),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("uq_jobs_active_scene_id", table_name="jobs")
@@ -0,0 +1,28 @@
+"""Add jobs status finished_at index
+
+Revision ID: f1c9a7d3b586
+Revises: d5a2c8e4f7b1
+Create Date: 2026-10-18 21:04:12.318406
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f1c9a7d3b586"
+down_revision: Union[str, Sequence[str], None] = "d5a2c8e4f7b1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_jobs_status_finished_at", "jobs", ["status", "finished_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_jobs_status_finished_at", table_name="jobs")
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+import math
+import typing as T
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+from loguru import logger
+
+import db
+from core.cache import TTLCache
+from core.config import (
+    ADMISSION_MAX_BACKLOG,
+    ADMISSION_MAX_WAIT,
+    ADMISSION_REFRESH,
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_WINDOW,
+)
+from core.metrics import ADMISSION_REJECTED
+from models.db import JOB_PENDING, JOB_RUNNING
+
+# the longest Retry-After ever suggested, in seconds
+MAX_RETRY_AFTER = 600
+
+
+class Admission(object):
+    def __init__(
+        self,
+        max_backlog: int = 0,
+        max_wait: float = 0,
+        window: float = 300,
+        refresh: float = 1.0,
+        retry_after: int = 30,
+    ):
+        """
+        Refuses new scenes while the pipeline is too far behind: more than
+        `max_backlog` jobs waiting or running, or an estimated wait longer
+        than `max_wait` seconds. The throughput behind the estimate is the
+        number of jobs done in the last `window` seconds.
+        """
+        self.max_backlog = max_backlog
+        self.max_wait = max_wait
+        self.window = window
+        self.retry_after = retry_after
+        self.cache = TTLCache("backlog", 1, refresh)
+        self.rejected = 0
+
+    async def _load(self) -> dict:
+        async with db.SessionLocal() as session:
+            counts = await db.count_jobs(session)
+            done = await db.count_jobs_done(
+                session, datetime.now() - timedelta(seconds=self.window)
+            )
+
+        pending = counts.get(JOB_PENDING, 0)
+        running = counts.get(JOB_RUNNING, 0)
+        # jobs per second over the window
+        throughput = done / self.window
+
+        return {
+            "pending": pending,
+            "running": running,
+            "backlog": pending + running,
+            "throughput": throughput,
+            "estimated_wait": (
+                (pending + running) / throughput if throughput > 0 else None
+            ),
+        }
+
+    async def backlog(self) -> dict:
+        """
+        The current backlog, refreshed at most every `refresh` seconds.
+        """
+        res = await self.cache.get_or_load("backlog", self._load)
+        return {**res, "accepting": self._retry_after(res) is None}
+
+    def _retry_after(self, backlog: dict) -> T.Optional[int]:
+        """
+        Seconds to wait before submitting again, None if a new scene is
+        accepted right now.
+        """
+        excess = 0.0
+        if self.max_backlog > 0 and backlog["backlog"] >= self.max_backlog:
+            excess = backlog["backlog"] - self.max_backlog + 1
+
+        wait = backlog["estimated_wait"]
+        if self.max_wait > 0 and wait is not None and wait > self.max_wait:
+            excess = max(excess, (wait - self.max_wait) * backlog["throughput"])
+
+        if excess <= 0:
+            return None
+
+        if backlog["throughput"] <= 0:
+            return self.retry_after
+
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(excess / backlog["throughput"])))
+
+    async def admit(self):
+        """
+        :raise HTTPException: 429 with a Retry-After header when the pipeline
+            is too far behind
+        """
+        if self.max_backlog <= 0 and self.max_wait <= 0:
+            return
+
+        backlog = await self.backlog()
+        retry_after = self._retry_after(backlog)
+        if retry_after is None:
+            return
+
+        self.rejected += 1
+        ADMISSION_REJECTED.inc()
+        logger.warning(
+            "scene refused", backlog=backlog["backlog"], retry_after=retry_after
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many scenes waiting, please retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+admission = Admission(
+    ADMISSION_MAX_BACKLOG,
+    ADMISSION_MAX_WAIT,
+    ADMISSION_WINDOW,
+    ADMISSION_REFRESH,
+    ADMISSION_RETRY_AFTER,
+)
+
+
+class AdmittedRoute(APIRoute):
+    """
+    Runs admission control on POST requests before their body is read, so
+    that refused uploads cost no bandwidth.
+    """
+
+    def get_route_handler(self) -> T.Callable[[Request], T.Awaitable[Response]]:
+        handler = super().get_route_handler()
+        if "POST" not in self.methods:
+            return handler
+
+        async def admitted(request: Request) -> Response:
+            await admission.admit()
+            return await handler(request)
+
+        return admitted
@@ -1,13 +1,20 @@
 import typing as T
 
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
 from sqlalchemy.exc import NoResultFound
 
 import db
+import pipeline
+import progress
+from core.balancer import balancers
+from core.cache import caches
+from core.hedge import hedgers
+from core.retry import breakers
 from s3 import storage
 from models.api import SceneOutput, SceneInput
+from models.db import SCENE_STATUSES
 from services.emailer import emailer
 
 
@@ -24,7 +31,7 @@ async def get_scene(scene_id: int):
     try:
         async with db.SessionLocal() as session:
             scene = await db.get_scene(session, scene_id)
-        logger.info(f"scene found: {scene}")
+        logger.info("scene found", scene_id=scene_id)
     except NoResultFound:
         logger.info("no scene found", scene_id=scene_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
@@ -80,12 +87,37 @@ async def approve_scene(scene_id: int):
     response_model=T.List[SceneOutput],
     name="admin:list",
 )
-async def list_scenes(limit: int = 10):
+async def list_scenes(
+    response: Response,
+    limit: int = 10,
+    cursor: T.Optional[str] = None,
+    summary: bool = False,
+    scene_status: T.Optional[str] = Query(None, alias="status"),
+):
+    """
+    Pass the X-Next-Cursor header of a page as `cursor` to get the next one.
+    With `summary`, the description and edit prompt are left out.
+    `status` only lists the scenes in that pipeline state.
+    """
+    if scene_status is not None and scene_status not in SCENE_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid status"
+        )
+
+    try:
+        after = db.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
     try:
         async with db.SessionLocal() as session:
-            scenes = await db.list_scenes(session, limit)
-            logger.debug(f"scenes: {scenes}")
-            return [await SceneOutput.from_db(scene) for scene in scenes]
+            scenes = await db.list_scenes(session, limit, after, summary, scene_status)
+            logger.debug("scenes listed", count=len(scenes))
+            if len(scenes) == limit:
+                response.headers["X-Next-Cursor"] = db.encode_cursor(scenes[-1])
+            return await SceneOutput.from_db_many(scenes)
     except NoResultFound:
         return JSONResponse(content=[])
     except Exception as e:
@@ -93,3 +125,58 @@ async def list_scenes(limit: int = 10):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
         )
+
+
+@router.get(
+    "/pipeline",
+    name="admin:pipeline",
+)
+async def pipeline_stats():
+    return pipeline.stats()
+
+
+@router.get(
+    "/caches",
+    name="admin:caches",
+)
+async def cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+@router.get(
+    "/replicas",
+    name="admin:replicas",
+)
+async def replica_stats():
+    return {name: balancer.stats() for name, balancer in balancers.items()}
+
+
+@router.get(
+    "/hedging",
+    name="admin:hedging",
+)
+async def hedging_stats():
+    return {name: hedger.stats() for name, hedger in hedgers.items()}
+
+
+@router.get(
+    "/breakers",
+    name="admin:breakers",
+)
+async def breaker_stats():
+    return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+@router.get(
+    "/events",
+    name="admin:events",
+)
+async def scene_events():
+    """
+    Server-sent events for each status change of every scene.
+    """
+    return StreamingResponse(
+        progress.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
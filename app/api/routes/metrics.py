@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+import collectors  # noqa: F401, registers the collector of the stats registries
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    name="metrics",
+    include_in_schema=False,
+)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,19 +1,72 @@
+import base64
+import binascii
+import hashlib
 import json
+import os
+import typing as T
+import tempfile
 from datetime import datetime
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import aiofiles
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.concurrency import run_in_threadpool
 from loguru import logger
+from PIL import Image, UnidentifiedImageError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import db
-from s3 import storage
-from pipeline import pipeline
+import ingest
+import progress
+from admission import AdmittedRoute, admission
+from core import digest, tracing
+from core.config import (
+    DESCRIPTION_CACHE_ENABLED,
+    INGEST_ENABLED,
+    INGEST_KEEP_ORIGINAL,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_MAX_SIZE,
+)
+from s3 import UploadTooLarge, storage
 from models.db import Scene
-from models.api import SceneOutput, SceneInput
+from models.api import BacklogOutput, SceneOutput, SceneInput
+
+router = APIRouter(route_class=AdmittedRoute)
+
 
-router = APIRouter()
+@router.get(
+    "/scene/backlog",
+    response_model=BacklogOutput,
+    name="scene:backlog",
+)
+async def get_backlog():
+    """
+    How far behind the pipeline is. New scenes are refused with 429 while
+    `accepting` is false.
+    """
+    return await admission.backlog()
+
+
+@router.get(
+    "/scene/{scene_id}/events",
+    name="scene:events",
+)
+async def scene_events(scene_id: int):
+    """
+    Server-sent events for each status change of the scene, starting with
+    its current status. The stream ends once the scene is edited or failed.
+    """
+    async with db.SessionLocal() as session:
+        scene = await db.get_scene(session, scene_id)
+    if scene is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    return StreamingResponse(
+        progress.stream(scene_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post(
@@ -21,25 +74,189 @@ router = APIRouter()
     response_model=SceneOutput,
     name="scene:create",
 )
-async def create_scene(data: SceneInput, bg: BackgroundTasks):
+@tracing.traced("create_scene")
+async def create_scene(data: SceneInput):
     if not data:
         raise HTTPException(status_code=400, detail="'data' argument invalid!")
 
-    fpath = await storage.save(data.original_data)
+    try:
+        content = base64.b64decode(data.original_data)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="'data' argument invalid!")
+    content_hash = await digest.sha256(content)
+    existing = await _find_upload(content_hash)
+    if existing is not None:
+        return await _create_duplicate(data.name, data.email, existing)
+
+    try:
+        if INGEST_ENABLED:
+            normalized = await ingest.normalize_async(content)
+        else:
+            normalized = content
+        phash = await _phash(normalized)
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="'data' argument invalid!")
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Image too large")
+
+    source = None
+    if INGEST_ENABLED:
+        fpath = await storage.save(normalized, ingest.content_type())
+        if INGEST_KEEP_ORIGINAL:
+            source = await storage.save(content)
+    else:
+        fpath = await storage.save(content)
+
+    return await _create(data.name, data.email, fpath, source, content_hash, phash)
+
+
+@router.post(
+    "/scene/stream",
+    response_model=SceneOutput,
+    name="scene:create_stream",
+)
+@tracing.traced("create_scene_stream")
+async def create_scene_stream(request: Request, name: str, email: str):
+    """
+    The raw image is the request body, it is streamed to the storage in chunks
+    instead of being read in memory.
+    """
+    content_type = request.headers.get("content-type", "application/octet-stream")
+    h = hashlib.sha256()
+    chunks = digest.hashed(request.stream(), h)
+    if not INGEST_ENABLED:
+        try:
+            fpath = await storage.save_stream(chunks, content_type)
+        except UploadTooLarge:
+            raise HTTPException(status_code=413, detail="Upload too large")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="'body' argument invalid!")
+
+        return await _create(name, email, fpath, None, h.hexdigest())
+
+    # normalizing needs the whole picture, it is spooled to disk rather than
+    # kept in memory
+    try:
+        tmp_path = await _spool(chunks)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Upload too large")
+    try:
+        content_hash = h.hexdigest()
+        existing = await _find_upload(content_hash)
+        if existing is not None:
+            return await _create_duplicate(name, email, existing)
 
+        try:
+            normalized = await ingest.normalize_async(tmp_path)
+            phash = await _phash(normalized)
+        except UnidentifiedImageError:
+            raise HTTPException(status_code=400, detail="'body' argument invalid!")
+        except Image.DecompressionBombError:
+            raise HTTPException(status_code=413, detail="Image too large")
+
+        fpath = await storage.save(normalized, ingest.content_type())
+        source = None
+        if INGEST_KEEP_ORIGINAL:
+            source = await storage.save_stream(_read_chunks(tmp_path), content_type)
+    finally:
+        os.remove(tmp_path)
+
+    return await _create(name, email, fpath, source, content_hash, phash)
+
+
+async def _find_upload(content_hash: str) -> T.Optional[Scene]:
+    """
+    A previous scene with the same upload, if any.
+    """
+    async with db.SessionLocal() as session:
+        scene = await db.find_scene_by_hash(session, content_hash)
+
+    if scene is not None:
+        logger.info("upload already stored", scene_id=scene.id)
+
+    return scene
+
+
+async def _create_duplicate(name: str, email: str, duplicate: Scene) -> SceneOutput:
+    return await _create(
+        name,
+        email,
+        duplicate.original_data,
+        duplicate.source_data,
+        duplicate.content_hash,
+        duplicate.phash,
+    )
+
+
+async def _phash(image: bytes) -> str | None:
+    """
+    The perceptual hash used by the description cache, only computed while
+    the cache is enabled. Without ingest the upload may not be a picture,
+    it is then stored without a hash.
+    """
+    if not DESCRIPTION_CACHE_ENABLED:
+        return None
+
+    try:
+        return await ingest.phash_async(image)
+    except UnidentifiedImageError:
+        if INGEST_ENABLED:
+            raise
+        logger.warning("upload is not a picture, not hashed")
+        return None
+
+
+async def _spool(chunks, max_size: int = UPLOAD_MAX_SIZE) -> str:
+    """
+    Write the chunks to a temporary file and return its path, the file is
+    removed if anything goes wrong.
+    """
+    fd, path = tempfile.mkstemp(prefix="upload-")
+    try:
+        os.close(fd)
+        size = 0
+        async with aiofiles.open(path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"upload is larger than {max_size} bytes")
+                await f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return path
+
+
+async def _read_chunks(path: str):
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+async def _create(
+    name: str,
+    email: str,
+    fpath: str,
+    source: str | None = None,
+    content_hash: str | None = None,
+    phash: str | None = None,
+) -> SceneOutput:
     ts = datetime.now()
     scene = Scene(
-        email=data.email,
-        name=data.name,
+        email=email,
+        name=name,
         created_at=ts,
         modified_at=ts,
         original_data=fpath,
+        source_data=source,
+        content_hash=content_hash,
+        phash=phash,
     )
     async with db.SessionLocal() as session:
-        await db.create_scene(session, scene)
-
-    logger.info("saved to disk", filepath=fpath, scene_id=scene.id)
+        job = await db.create_scene_job(session, scene, tracing.inject())
+    tracing.set_scene(scene.id)
 
-    bg.add_task(pipeline, scene)
+    logger.info("saved to disk", filepath=fpath, scene_id=scene.id, job_id=job.id)
 
     return await SceneOutput.from_db(scene)
@@ -0,0 +1,112 @@
+"""
+Peak RSS of the edit step, from the image editor response to the upload.
+
+Each path runs in its own interpreter so that peaks don't leak between runs:
+
+    cd app && python -m benchmarks.edit_memory --scenes 5
+
+The "legacy" path reproduces the base64 hand-offs that used to happen between
+ImageEditor.run, framer.frame and S3Storage.save; the "current" path uses the
+code as it is now, with the upload replaced by a no-op.
+"""
+
+import argparse
+import base64
+from io import BytesIO
+import os
+import resource
+import subprocess
+import sys
+
+from PIL import Image
+
+import framer
+
+
+def peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def editor_response(width: int, height: int) -> dict:
+    img = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    encoded = base64.b64encode(buf.getvalue()).decode()
+    return {"images": ["data:image/png;base64," + encoded]}
+
+
+def legacy_frame(frame_path: str, image: str) -> str:
+    border = framer.load_border(frame_path)
+    img = Image.open(BytesIO(base64.b64decode(image))).convert("RGBA")
+    border_w, border_h = border.size
+    margin_h = int(border_h * 0.071)
+    margin_w = int(border_w * 0.051)
+    img = img.resize(
+        (border_w - 2 * margin_w, border_h - int(3.3 * margin_h)),
+        Image.Resampling.LANCZOS,
+    )
+    border_copy = border.copy()
+    border_copy.paste(img, (margin_w, margin_h), img)
+    framed_bytes = BytesIO()
+    border_copy.save(framed_bytes, format="PNG")
+    framed_bytes.seek(0)
+    return base64.b64encode(framed_bytes.read()).decode()
+
+
+def legacy_scene(response: dict):
+    image = response["images"][0].rsplit(",")[1]
+    framed = legacy_frame(framer.FRAME_PATH, image)
+    upload = BytesIO(base64.b64decode(framed))
+    upload.getbuffer().nbytes
+
+
+def current_scene(response: dict):
+    image = base64.b64decode(response["images"][0].rsplit(",")[1])
+    framed = framer.frame(framer.FRAME_PATH, image)
+    memoryview(framed).nbytes
+
+
+def run_path(path: str, scenes: int, width: int, height: int):
+    framer.load_border(framer.FRAME_PATH)
+    run = legacy_scene if path == "legacy" else current_scene
+
+    response = editor_response(width, height)
+    baseline = peak_rss_kb()
+    for _ in range(scenes):
+        run(response)
+
+    print(
+        f"{path:>8}: peak rss {peak_rss_kb() / 1024:.1f} MiB, "
+        f"+{(peak_rss_kb() - baseline) / 1024:.1f} MiB per scene"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenes", type=int, default=5)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--path", choices=["legacy", "current"])
+
+    args = parser.parse_args()
+
+    if args.path:
+        run_path(args.path, args.scenes, args.width, args.height)
+    else:
+        for path in ("legacy", "current"):
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.edit_memory",
+                    "--path",
+                    path,
+                    "--scenes",
+                    str(args.scenes),
+                    "--width",
+                    str(args.width),
+                    "--height",
+                    str(args.height),
+                ],
+                check=True,
+            )
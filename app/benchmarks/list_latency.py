@@ -0,0 +1,79 @@
+"""
+Latency of serializing a page of scenes for admin:list, against a fake
+storage backend whose url signing takes a fixed time:
+
+    cd app && python -m benchmarks.list_latency --latency 0.05
+
+Compares the sequential serialization that list_scenes used to do with
+SceneOutput.from_db_many, for a growing `limit`.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+import time
+
+from models import api
+from models.db import Scene
+
+
+class FakeStorage(object):
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def get_presigned_url(self, obj_url: str, expiration: int = 300) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return f"https://storage.example/{obj_url}?expires={expiration}"
+
+
+def fake_scenes(limit: int) -> list[Scene]:
+    ts = datetime.now()
+    return [
+        Scene(
+            id=i,
+            email="bench@example.com",
+            name="bench",
+            created_at=ts,
+            modified_at=ts,
+            original_data=f"gs://bench/original-{i}",
+            result=f"gs://bench/result-{i}",
+        )
+        for i in range(limit)
+    ]
+
+
+async def sequential(scenes: list[Scene]):
+    return [await api.SceneOutput.from_db(scene) for scene in scenes]
+
+
+async def batched(scenes: list[Scene]):
+    return await api.SceneOutput.from_db_many(scenes)
+
+
+async def measure(f, scenes: list[Scene]) -> float:
+    start = time.perf_counter()
+    await f(scenes)
+    return (time.perf_counter() - start) * 1000
+
+
+async def _run(latency: float, limits: list[int]):
+    api.storage = FakeStorage(latency)
+
+    print(f"{'limit':>6} {'sequential ms':>14} {'batched ms':>11}")
+    for limit in limits:
+        scenes = fake_scenes(limit)
+        seq = await measure(sequential, scenes)
+        bat = await measure(batched, scenes)
+        print(f"{limit:>6} {seq:>14.1f} {bat:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 10, 25, 50, 100])
+
+    args = parser.parse_args()
+
+    asyncio.run(_run(args.latency, args.limits))
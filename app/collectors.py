@@ -0,0 +1,151 @@
+import typing as T
+
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from core import logging as log
+from core.balancer import balancers
+from core.cache import caches
+from core.events import bus
+from core.hedge import hedgers
+from core.retry import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, breakers
+
+# cache counters, as named by the cache stats
+CACHE_RESULTS = ("hits", "misses", "coalesced", "memory_hits", "db_hits")
+
+
+class RegistryCollector(object):
+    """
+    Exports the counters that caches, circuit breakers, balancers, hedgers,
+    the event bus and logging already keep, reading them at scrape time only.
+    """
+
+    def collect(self) -> T.Iterator:
+        yield from self._caches()
+        yield from self._breakers()
+        yield from self._balancers()
+        yield from self._hedgers()
+        yield from self._events()
+        yield from self._logs()
+
+    def _caches(self) -> T.Iterator:
+        lookups = CounterMetricFamily(
+            "aie_cache_lookups", "Cache lookups by result", labels=["cache", "result"]
+        )
+        entries = GaugeMetricFamily(
+            "aie_cache_entries", "Entries held by a cache", labels=["cache"]
+        )
+        for name, cache in list(caches.items()):
+            stats = cache.stats()
+            for result in CACHE_RESULTS:
+                if result in stats:
+                    lookups.add_metric([name, result], stats[result])
+            entries.add_metric([name], stats["size"])
+        yield lookups
+        yield entries
+
+    def _breakers(self) -> T.Iterator:
+        state = GaugeMetricFamily(
+            "aie_circuit_state",
+            "1 for the current state of a circuit breaker",
+            labels=["breaker", "state"],
+        )
+        rejected = CounterMetricFamily(
+            "aie_circuit_rejected",
+            "Calls refused by an open circuit",
+            labels=["breaker"],
+        )
+        opened = CounterMetricFamily(
+            "aie_circuit_opened", "Times a circuit opened", labels=["breaker"]
+        )
+        for name, breaker in list(breakers.items()):
+            for s in (CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN):
+                state.add_metric([name, s], 1 if breaker.state == s else 0)
+            rejected.add_metric([name], breaker.rejected)
+            opened.add_metric([name], breaker.opened)
+        yield state
+        yield rejected
+        yield opened
+
+    def _balancers(self) -> T.Iterator:
+        labels = ["service", "replica"]
+        outstanding = GaugeMetricFamily(
+            "aie_replica_outstanding", "Calls in flight on a replica", labels=labels
+        )
+        healthy = GaugeMetricFamily(
+            "aie_replica_healthy", "1 unless the replica is ejected", labels=labels
+        )
+        requests = CounterMetricFamily(
+            "aie_replica_requests", "Calls sent to a replica", labels=labels
+        )
+        errors = CounterMetricFamily(
+            "aie_replica_errors", "Calls failed by a replica", labels=labels
+        )
+        for name, balancer in list(balancers.items()):
+            for replica in balancer.stats()["replicas"]:
+                key = [name, replica["addr"]]
+                outstanding.add_metric(key, replica["outstanding"])
+                healthy.add_metric(key, 1 if replica["healthy"] else 0)
+                requests.add_metric(key, replica["requests"])
+                errors.add_metric(key, replica["errors"])
+        yield outstanding
+        yield healthy
+        yield requests
+        yield errors
+
+    def _hedgers(self) -> T.Iterator:
+        calls = CounterMetricFamily(
+            "aie_hedge_calls", "Calls going through a hedger", labels=["service"]
+        )
+        hedged = CounterMetricFamily(
+            "aie_hedged", "Calls sent a second time", labels=["service"]
+        )
+        wins = CounterMetricFamily(
+            "aie_hedge_wins",
+            "Hedged calls answered by the second copy first",
+            labels=["service"],
+        )
+        for name, hedger in list(hedgers.items()):
+            calls.add_metric([name], hedger.calls)
+            hedged.add_metric([name], hedger.hedged)
+            wins.add_metric([name], hedger.hedge_wins)
+        yield calls
+        yield hedged
+        yield wins
+
+    def _events(self) -> T.Iterator:
+        yield GaugeMetricFamily(
+            "aie_event_subscribers",
+            "Clients following scene events",
+            value=bus.subscriber_count(),
+        )
+        yield CounterMetricFamily(
+            "aie_events_published", "Scene events published", value=bus.published
+        )
+        yield CounterMetricFamily(
+            "aie_events_dropped",
+            "Scene events dropped for slow subscribers",
+            value=bus.dropped,
+        )
+
+    def _logs(self) -> T.Iterator:
+        if log.queue_sink is not None:
+            yield GaugeMetricFamily(
+                "aie_log_queued",
+                "Log records waiting for the writer thread",
+                value=log.queue_sink.queue.qsize(),
+            )
+            yield CounterMetricFamily(
+                "aie_logs_dropped",
+                "Log records dropped on a full queue",
+                value=log.queue_sink.dropped,
+            )
+        if log.sampler is not None:
+            yield CounterMetricFamily(
+                "aie_logs_sampled_out",
+                "Log records left out by sampling",
+                value=log.sampler.sampled_out,
+            )
+
+
+REGISTRY.register(RegistryCollector())
@@ -0,0 +1,128 @@
+import contextlib
+import random
+import time
+import typing as T
+
+from loguru import logger
+
+from core.retry import endpoint_failure
+
+# every balancer registers itself here so that its replicas can be reported
+balancers: T.Dict[str, "Balancer"] = {}
+
+
+class Replica(object):
+    def __init__(self, addr: str):
+        self.addr = addr
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def stats(self, now: float) -> dict:
+        return {
+            "addr": self.addr,
+            "healthy": self.healthy(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejected_for": max(0.0, self.ejected_until - now),
+        }
+
+
+class Balancer(object):
+    def __init__(
+        self, name: str, addr: str, eject_after: int = 3, eject_for: float = 30.0
+    ):
+        """
+        Spreads calls over the comma separated replicas of `addr`, sending
+        each one to the healthy replica with the fewest outstanding calls.
+        A replica failing `eject_after` calls in a row is left out for
+        `eject_for` seconds.
+        """
+        self.name = name
+        addrs = [a.strip() for a in addr.split(",") if a.strip()] or [addr]
+        self.replicas = [Replica(a) for a in addrs]
+        self.eject_after = eject_after
+        self.eject_for = eject_for
+
+        balancers[name] = self
+
+    @property
+    def addrs(self) -> T.List[str]:
+        return [replica.addr for replica in self.replicas]
+
+    def pick(self) -> Replica:
+        now = time.monotonic()
+        healthy = [r for r in self.replicas if r.healthy(now)]
+        if not healthy:
+            # everything is ejected, try the one coming back first
+            return min(self.replicas, key=lambda r: r.ejected_until)
+
+        least = min(r.outstanding for r in healthy)
+        return random.choice([r for r in healthy if r.outstanding == least])
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> T.AsyncIterator[str]:
+        """
+        Picks a replica for the duration of one call and yields its address.
+        """
+        replica = self.pick()
+        replica.outstanding += 1
+        replica.requests += 1
+        try:
+            yield replica.addr
+        except BaseException as e:
+            if endpoint_failure(e):
+                self._failed(replica)
+            raise
+        else:
+            replica.consecutive_errors = 0
+        finally:
+            replica.outstanding -= 1
+
+    def _failed(self, replica: Replica):
+        replica.errors += 1
+        replica.consecutive_errors += 1
+        if replica.consecutive_errors >= self.eject_after:
+            replica.ejected_until = time.monotonic() + self.eject_for
+            replica.consecutive_errors = 0
+            logger.warning(
+                "replica ejected",
+                balancer=self.name,
+                addr=replica.addr,
+                seconds=self.eject_for,
+            )
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "eject_after": self.eject_after,
+            "eject_for": self.eject_for,
+            "replicas": [replica.stats(now) for replica in self.replicas],
+        }
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    import httpx
+
+    balancer = Balancer("probe", "http://a, http://b, http://c", 2, 0.5)
+
+    async def call(i: int):
+        async with balancer.acquire() as addr:
+            await asyncio.sleep(0.01 * (1 + i % 3))
+            if addr == "http://c":
+                raise httpx.ConnectError("down")
+
+    async def _run():
+        for _ in range(3):
+            await asyncio.gather(*[call(i) for i in range(12)], return_exceptions=True)
+            print(balancer.stats())
+
+    asyncio.run(_run())
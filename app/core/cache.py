@@ -0,0 +1,162 @@
+import asyncio
+from collections import OrderedDict
+import time
+import typing as T
+
+
+class Cache(T.Protocol):
+    def stats(self) -> dict:
+        """
+        The counters of the cache, with at least its "size".
+        """
+        ...
+
+
+# every cache registers itself here so that its counters can be reported
+caches: T.Dict[str, Cache] = {}
+
+# returned by SingleFlight.wait when the load it waited for was cancelled
+CANCELLED = object()
+
+
+class SingleFlight(object):
+    def __init__(self):
+        """
+        The loads in progress, by key, so that concurrent misses share a
+        single load. Its errors are passed to every caller waiting for it,
+        but if the caller that started it is cancelled the waiters get
+        CANCELLED, and may start a new load.
+        """
+        self.pending: T.Dict[T.Hashable, asyncio.Future] = {}
+
+    async def wait(self, key: T.Hashable) -> T.Any:
+        pending = self.pending[key]
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # the caller that started the load was cancelled, not this one
+            if not pending.cancelled() or asyncio.current_task().cancelling():
+                raise
+            return CANCELLED
+
+    async def run(
+        self, key: T.Hashable, loader: T.Callable[[], T.Awaitable[T.Any]]
+    ) -> T.Any:
+        fut = asyncio.get_running_loop().create_future()
+        self.pending[key] = fut
+        try:
+            value = await loader()
+        except Exception as e:
+            fut.set_exception(e)
+            # the exception is re-raised below, don't let the loop warn about it
+            fut.exception()
+            raise
+        except BaseException:
+            fut.cancel()
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            del self.pending[key]
+
+
+class TTLCache(object):
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        """
+        In-process LRU cache whose entries expire after `ttl` seconds.
+        Concurrent misses for the same key share a single load, see
+        SingleFlight.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[T.Hashable, T.Tuple[float, T.Any]] = OrderedDict()
+        self.loads = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        caches[name] = self
+
+    def get(self, key: T.Hashable) -> T.Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: T.Hashable, value: T.Any, ttl: T.Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(
+        self,
+        key: T.Hashable,
+        loader: T.Callable[[], T.Awaitable[T.Any]],
+        ttl: T.Optional[float] = None,
+    ) -> T.Any:
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            if key not in self.loads.pending:
+                break
+
+            self.coalesced += 1
+            value = await self.loads.wait(key)
+            if value is not CANCELLED:
+                return value
+
+        self.misses += 1
+        value = await self.loads.run(key, loader)
+        self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    cache = TTLCache("probe", 2, 1)
+    calls = 0
+
+    async def load():
+        global calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return calls
+
+    async def _run():
+        print(await asyncio.gather(*[cache.get_or_load("a", load) for _ in range(5)]))
+        print(await cache.get_or_load("a", load))
+        await asyncio.sleep(1.1)
+        print(await cache.get_or_load("a", load))
+        print(cache.stats())
+
+    asyncio.run(_run())
@@ -1,8 +1,6 @@
 import logging
-import sys
 
-from core.logging import InterceptHandler
-from loguru import logger
+from core import logging as log
 from starlette.config import Config
 from starlette.datastructures import Secret
 
@@ -14,16 +12,146 @@ DEBUG: bool = config("DEBUG", cast=bool, default=False)
 DATABASE_URL: str = config("DATABASE_URL", default="sqlite:///./app.db")
 LOCAL_PATH: str = config("LOCAL_PATH", default="/data")
 
+# model endpoints take a comma separated list of replicas, each call goes to the
+# healthy replica with the fewest calls in flight
 DESCRIBER_URL: str = config("DESCRIBER_URL", default="")
 DESCRIBER_API_KEY: str = config("DESCRIBER_API_KEY", default="")
+# ask the describer for the edit prompt too, skipping the prompter call
+PIPELINE_FUSED: bool = config("PIPELINE_FUSED", cast=bool, default=False)
+# reuse the description of a near-identical picture, matched by perceptual hash
+DESCRIPTION_CACHE_ENABLED: bool = config(
+    "DESCRIPTION_CACHE_ENABLED", cast=bool, default=False
+)
+DESCRIPTION_CACHE_SIZE: int = config("DESCRIPTION_CACHE_SIZE", cast=int, default=1024)
+# maximum number of differing hash bits, at most 7
+DESCRIPTION_CACHE_DISTANCE: int = config(
+    "DESCRIPTION_CACHE_DISTANCE", cast=int, default=4
+)
 
 PROMPTER_URL: str = config("PROMPTER_URL", default="")
 PROMPTER_API_KEY: str = config("PROMPTER_API_KEY", default="")
+# prompts are cached per normalized description, 0 disables the cache
+PROMPT_CACHE_SIZE: int = config("PROMPT_CACHE_SIZE", cast=int, default=1024)
+PROMPT_CACHE_TTL: float = config("PROMPT_CACHE_TTL", cast=float, default=24 * 3600)
 
 IMAGE_EDITOR_URL: str = config("IMAGE_EDITOR_URL", default="")
 IMAGE_EDITOR_API_KEY: str = config("IMAGE_EDITOR_API_KEY", default="")
+IMAGE_EDITOR_CONNECT_TIMEOUT: float = config(
+    "IMAGE_EDITOR_CONNECT_TIMEOUT", cast=float, default=5.0
+)
+IMAGE_EDITOR_READ_TIMEOUT: float = config(
+    "IMAGE_EDITOR_READ_TIMEOUT", cast=float, default=120.0
+)
+IMAGE_EDITOR_MAX_CONNECTIONS: int = config(
+    "IMAGE_EDITOR_MAX_CONNECTIONS", cast=int, default=10
+)
+IMAGE_EDITOR_HTTP2: bool = config("IMAGE_EDITOR_HTTP2", cast=bool, default=False)
+# a replica failing this many calls in a row is left out for a while
+REPLICA_EJECT_AFTER: int = config("REPLICA_EJECT_AFTER", cast=int, default=3)
+REPLICA_EJECT_SECONDS: float = config("REPLICA_EJECT_SECONDS", cast=float, default=30.0)
+
+# a model endpoint failing this many calls in a row is not called for a while
+BREAKER_FAILURE_THRESHOLD: int = config(
+    "BREAKER_FAILURE_THRESHOLD", cast=int, default=5
+)
+BREAKER_RESET_SECONDS: float = config("BREAKER_RESET_SECONDS", cast=float, default=30.0)
+# new scenes are refused while more jobs than this are waiting or running, or
+# while the estimated wait is longer than this many seconds, 0 disables either
+ADMISSION_MAX_BACKLOG: int = config("ADMISSION_MAX_BACKLOG", cast=int, default=0)
+ADMISSION_MAX_WAIT: float = config("ADMISSION_MAX_WAIT", cast=float, default=0)
+# the pipeline throughput is measured over this many seconds
+ADMISSION_WINDOW: float = config("ADMISSION_WINDOW", cast=float, default=300)
+# seconds the backlog figures are reused for
+ADMISSION_REFRESH: float = config("ADMISSION_REFRESH", cast=float, default=1.0)
+# suggested wait when the throughput is unknown
+ADMISSION_RETRY_AFTER: int = config("ADMISSION_RETRY_AFTER", cast=int, default=30)
+
+# describer and prompter calls still running after this percentile of their
+# recent latencies are sent a second time, to another replica when possible
+HEDGE_ENABLED: bool = config("HEDGE_ENABLED", cast=bool, default=False)
+HEDGE_PERCENTILE: float = config("HEDGE_PERCENTILE", cast=float, default=0.95)
+# at most this fraction of extra calls
+HEDGE_BUDGET: float = config("HEDGE_BUDGET", cast=float, default=0.1)
+HEDGE_MIN_SAMPLES: int = config("HEDGE_MIN_SAMPLES", cast=int, default=20)
+
+# maximum number of concurrent calls per pipeline stage, in each worker
+DESCRIBE_CONCURRENCY: int = config("DESCRIBE_CONCURRENCY", cast=int, default=1)
+PROMPT_CONCURRENCY: int = config("PROMPT_CONCURRENCY", cast=int, default=1)
+EDIT_CONCURRENCY: int = config("EDIT_CONCURRENCY", cast=int, default=1)
+
+# durable job queue consumed by worker.py
+WORKER_CONCURRENCY: int = config("WORKER_CONCURRENCY", cast=int, default=4)
+WORKER_POLL_INTERVAL: float = config("WORKER_POLL_INTERVAL", cast=float, default=1.0)
+# a running job whose worker sent no heartbeat for this long is claimed again
+JOB_VISIBILITY_TIMEOUT: int = config("JOB_VISIBILITY_TIMEOUT", cast=int, default=600)
+JOB_MAX_ATTEMPTS: int = config("JOB_MAX_ATTEMPTS", cast=int, default=3)
+# a failed attempt is retried after about this many seconds, doubled each time
+JOB_RETRY_BACKOFF: float = config("JOB_RETRY_BACKOFF", cast=float, default=30.0)
+# a scene whose upload is being processed by an older scene waits this long
+# before checking again
+JOB_DUPLICATE_DELAY: float = config("JOB_DUPLICATE_DELAY", cast=float, default=5.0)
+# run a worker inside the API process, handy for local development with
+# DATABASE_URL=sqlite+aiosqlite:///./app.db
+EMBEDDED_WORKER: bool = config("EMBEDDED_WORKER", cast=bool, default=False)
+# on startup, queue again the scenes left half-processed without a live job
+RESUME_ON_STARTUP: bool = config("RESUME_ON_STARTUP", cast=bool, default=True)
+
+# seconds between checks for scene changes made by other processes, while
+# someone follows the scene events; 0 only reports this process' changes
+PROGRESS_POLL_INTERVAL: float = config(
+    "PROGRESS_POLL_INTERVAL", cast=float, default=1.0
+)
+# seconds of scene changes looked at again on every check, as changes commit
+# after their modified_at and with the clock of the process that made them
+PROGRESS_LOOKBACK: float = config("PROGRESS_LOOKBACK", cast=float, default=30.0)
+# seconds between keep-alive comments on idle event streams
+PROGRESS_HEARTBEAT: float = config("PROGRESS_HEARTBEAT", cast=float, default=15.0)
+# spans are exported to an OTLP/HTTP collector ("otlp"), appended to a JSON
+# lines file ("file"), or not recorded ("none"); a fraction of the traces is kept
+TRACING_EXPORTER: str = config("TRACING_EXPORTER", default="none")
+TRACING_ENDPOINT: str = config(
+    "TRACING_ENDPOINT", default="http://localhost:4318/v1/traces"
+)
+TRACING_FILE: str = config("TRACING_FILE", default="traces.jsonl")
+TRACING_SAMPLE_RATIO: float = config("TRACING_SAMPLE_RATIO", cast=float, default=0.1)
+
+# standalone workers serve /metrics on this port, 0 disables it
+METRICS_PORT: int = config("METRICS_PORT", cast=int, default=0)
+
+# image work (framing, ingest) runs off the event loop, in a "process" or
+# "thread" pool, FRAMER_EXECUTOR and FRAMER_WORKERS are still read as before
+IMAGE_EXECUTOR: str = config(
+    "IMAGE_EXECUTOR", default=config("FRAMER_EXECUTOR", default="process")
+)
+IMAGE_WORKERS: int = config(
+    "IMAGE_WORKERS", cast=int, default=config("FRAMER_WORKERS", cast=int, default=2)
+)
+
+# uploads are normalized before being stored: EXIF orientation applied,
+# metadata stripped, downscaled to fit the max size and re-encoded
+INGEST_ENABLED: bool = config("INGEST_ENABLED", cast=bool, default=True)
+INGEST_MAX_WIDTH: int = config("INGEST_MAX_WIDTH", cast=int, default=1920)
+INGEST_MAX_HEIGHT: int = config("INGEST_MAX_HEIGHT", cast=int, default=1920)
+INGEST_FORMAT: str = config("INGEST_FORMAT", default="JPEG")
+INGEST_QUALITY: int = config("INGEST_QUALITY", cast=int, default=90)
+# also store the upload as it was received
+INGEST_KEEP_ORIGINAL: bool = config("INGEST_KEEP_ORIGINAL", cast=bool, default=False)
 
 S3_BUCKET: str = config("S3_BUCKET", default="")
+# bytes buffered per request by streaming uploads, rounded to 256 KiB
+UPLOAD_CHUNK_SIZE: int = config("UPLOAD_CHUNK_SIZE", cast=int, default=1024 * 1024)
+# larger streamed uploads are refused
+UPLOAD_MAX_SIZE: int = config("UPLOAD_MAX_SIZE", cast=int, default=50 * 1024 * 1024)
+# concurrent url signing calls when serializing a list of scenes
+LIST_URL_FANOUT: int = config("LIST_URL_FANOUT", cast=int, default=16)
+# signed urls are cached per (object, expiration), 0 disables the cache
+PRESIGNED_URL_CACHE_SIZE: int = config(
+    "PRESIGNED_URL_CACHE_SIZE", cast=int, default=4096
+)
+# fraction of the url lifetime left when a cached url stops being served
+PRESIGNED_URL_CACHE_MARGIN: float = config(
+    "PRESIGNED_URL_CACHE_MARGIN", cast=float, default=0.2
+)
 
 EMAIL_SMTP: str = config("EMAIL_SMTP", default="")
 EMAIL_SMTP_USER: str = config("EMAIL_SMTP_USER", default="")
@@ -33,7 +161,23 @@ PROJECT_NAME: str = config("PROJECT_NAME", default="aie")
 
 # logging configuration
 LOGGING_LEVEL = logging.DEBUG if DEBUG else logging.INFO
+# one JSON object per line instead of text
+LOG_SERIALIZE: bool = config("LOG_SERIALIZE", cast=bool, default=False)
+# longer fields are truncated, or hashed when they look like payloads
+LOG_MAX_FIELD_LENGTH: int = config("LOG_MAX_FIELD_LENGTH", cast=int, default=256)
+LOG_MAX_MESSAGE_LENGTH: int = config("LOG_MAX_MESSAGE_LENGTH", cast=int, default=2048)
+# records buffered for the writer thread, 0 writes from the caller
+LOG_QUEUE_SIZE: int = config("LOG_QUEUE_SIZE", cast=int, default=10000)
+# fraction of records kept per message, e.g. "presigned url generated=0.01"
+LOG_SAMPLING: str = config("LOG_SAMPLING", default="")
 logging.basicConfig(
-    handlers=[InterceptHandler(level=LOGGING_LEVEL)], level=LOGGING_LEVEL
+    handlers=[log.InterceptHandler(level=LOGGING_LEVEL)], level=LOGGING_LEVEL
+)
+log.configure(
+    LOGGING_LEVEL,
+    serialize=LOG_SERIALIZE,
+    max_field_length=LOG_MAX_FIELD_LENGTH,
+    max_message_length=LOG_MAX_MESSAGE_LENGTH,
+    queue_size=LOG_QUEUE_SIZE,
+    sampling=LOG_SAMPLING,
 )
-logger.configure(handlers=[{"sink": sys.stderr, "level": LOGGING_LEVEL}])
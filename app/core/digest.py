@@ -0,0 +1,26 @@
+import asyncio
+import hashlib
+import typing as T
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+async def sha256(content: bytes) -> str:
+    """
+    Hex SHA-256 of the content. hashlib releases the GIL on large buffers,
+    so it is computed in a thread to keep the event loop free.
+    """
+    return await asyncio.to_thread(_sha256, content)
+
+
+async def hashed(
+    chunks: T.AsyncIterator[bytes], h: "hashlib._Hash"
+) -> T.AsyncIterator[bytes]:
+    """
+    Pass the chunks through, feeding them to `h` on the way.
+    """
+    async for chunk in chunks:
+        h.update(chunk)
+        yield chunk
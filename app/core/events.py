@@ -0,0 +1,71 @@
+import asyncio
+from collections import OrderedDict
+import contextlib
+import typing as T
+
+from loguru import logger
+
+
+class EventBus(object):
+    def __init__(self, queue_size: int = 64, history: int = 4096):
+        """
+        Fans scene events out to subscribers, each one with a bounded queue:
+        a subscriber that doesn't keep up loses its oldest events rather than
+        holding memory. Events already published for the same scene state
+        are dropped, so that several sources can feed the bus.
+        """
+        self.queue_size = queue_size
+        self.history = history
+        self.last: OrderedDict[int, T.Tuple[T.Any, ...]] = OrderedDict()
+        # subscribers per scene id, None subscribes to every scene
+        self.subscribers: T.Dict[T.Optional[int], T.Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event: dict):
+        scene_id = event["scene_id"]
+        key = (event["status"], event["modified_at"])
+        if self.last.get(scene_id) == key:
+            return
+
+        self.last[scene_id] = key
+        self.last.move_to_end(scene_id)
+        while len(self.last) > self.history:
+            self.last.popitem(last=False)
+
+        self.published += 1
+        for topic in (scene_id, None):
+            for queue in self.subscribers.get(topic, ()):
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(event)
+
+    @contextlib.contextmanager
+    def subscribe(self, scene_id: T.Optional[int] = None) -> T.Iterator[asyncio.Queue]:
+        """
+        Queue receiving the events of `scene_id`, or of every scene.
+        """
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(scene_id, set()).add(queue)
+        logger.debug("subscribed to scene events", scene_id=scene_id)
+        try:
+            yield queue
+        finally:
+            queue_set = self.subscribers[scene_id]
+            queue_set.discard(queue)
+            if not queue_set:
+                del self.subscribers[scene_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self.subscribers.values())
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count(),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+bus = EventBus()
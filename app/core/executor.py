@@ -0,0 +1,48 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import typing as T
+
+from core.config import IMAGE_EXECUTOR, IMAGE_WORKERS
+
+_executor: Executor | None = None
+
+
+def get_executor() -> Executor:
+    """
+    The pool shared by the CPU-heavy image work (framing, ingest), created on
+    first use. It runs "process" or "thread" workers depending on the config.
+    Processes are started by a forkserver: by the time of the first use this
+    process runs threads, and forking it could copy a lock one of them holds.
+    """
+    global _executor
+
+    if _executor is None:
+        if IMAGE_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_WORKERS, thread_name_prefix="image"
+            )
+
+    return _executor
+
+
+async def run(f: T.Callable, *args) -> T.Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), f, *args)
+
+
+async def shutdown():
+    """
+    Wait for the image work in progress from a thread, so that the event
+    loop keeps serving meanwhile.
+    """
+    global _executor
+
+    if _executor is not None:
+        executor, _executor = _executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True)
@@ -0,0 +1,144 @@
+import asyncio
+from collections import deque
+import time
+import typing as T
+
+from loguru import logger
+
+# every hedger registers itself here so that its counters can be reported
+hedgers: T.Dict[str, "Hedger"] = {}
+
+R = T.TypeVar("R")
+
+
+class Hedger(object):
+    def __init__(
+        self,
+        name: str,
+        enabled: bool = False,
+        percentile: float = 0.95,
+        budget: float = 0.1,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        """
+        Sends a second copy of a call that is still running after the
+        `percentile` of the recent latencies, and keeps the first answer.
+        Every call earns `budget` hedges, so hedging adds at most that
+        fraction of extra calls; nothing is hedged until `min_samples`
+        latencies have been seen.
+        Latencies are kept per kind of call, since calls of different kinds
+        to the same service may take very different times.
+        """
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies: T.Dict[str, T.Deque[float]] = {}
+        # hedges that can be sent right now, capped to absorb short bursts only
+        self.tokens = 0.0
+        self.max_tokens = max(1.0, budget * min_samples)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+        hedgers[name] = self
+
+    def delay(self, kind: str = "default") -> T.Optional[float]:
+        latencies = sorted(self.latencies.get(kind, ()))
+        if len(latencies) < self.min_samples:
+            return None
+
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile))]
+
+    async def _timed(self, f: T.Callable[[], T.Awaitable[R]]) -> T.Tuple[R, float]:
+        start = time.perf_counter()
+        res = await f()
+        return res, time.perf_counter() - start
+
+    async def run(self, f: T.Callable[[], T.Awaitable[R]], kind: str = "default") -> R:
+        """
+        :param f: makes one call, invoked a second time when the call is hedged
+        :param kind: the latency window the call is timed against
+        """
+        self.calls += 1
+        self.tokens = min(self.max_tokens, self.tokens + self.budget)
+        latencies = self.latencies.setdefault(kind, deque(maxlen=self.window))
+
+        delay = self.delay(kind) if self.enabled else None
+        first = asyncio.ensure_future(self._timed(f))
+        started = {first: time.perf_counter()}
+        tasks = {first}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.hedged += 1
+                    logger.debug("hedging call", hedger=self.name, delay=delay)
+                    hedge = asyncio.ensure_future(self._timed(f))
+                    started[hedge] = time.perf_counter()
+                    tasks.add(hedge)
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+
+                    res, elapsed = task.result()
+                    latencies.append(elapsed)
+                    winner = winner or task
+
+                if winner is not None:
+                    if winner is not first:
+                        self.hedge_wins += 1
+                    # the copy left behind took at least this long, leaving it
+                    # out would make the delay shrink with every hedge won
+                    now = time.perf_counter()
+                    for task in tasks:
+                        latencies.append(now - started[task])
+                    return winner.result()[0]
+
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "delays": {kind: self.delay(kind) for kind in self.latencies},
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import random
+
+    hedger = Hedger("probe", True, 0.9, 0.2, 100, 10)
+
+    async def call() -> float:
+        latency = 1.0 if random.random() < 0.05 else 0.01
+        await asyncio.sleep(latency)
+        return latency
+
+    async def _run():
+        start = time.perf_counter()
+        for _ in range(200):
+            await hedger.run(call)
+        print(f"{time.perf_counter() - start:.2f}s", hedger.stats())
+
+    asyncio.run(_run())
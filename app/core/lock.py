@@ -1,5 +1,14 @@
 import asyncio
 import functools
+import time
+
+from core.metrics import (
+    STAGE_ERRORS,
+    STAGE_IN_FLIGHT,
+    STAGE_SECONDS,
+    STAGE_WAIT_SECONDS,
+    STAGE_WAITING,
+)
 
 
 def with_lock(lock: asyncio.Lock):
@@ -14,6 +23,70 @@ def with_lock(lock: asyncio.Lock):
     return wrapper
 
 
+class StageLimiter(object):
+    def __init__(self, name: str, concurrency: int):
+        """
+        Bounds how many calls of a pipeline stage run at the same time and
+        keeps track of how many are running and how many are waiting.
+        """
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.wait_seconds = STAGE_WAIT_SECONDS.labels(name)
+        self.waiting_gauge = STAGE_WAITING.labels(name)
+        self.in_flight_gauge = STAGE_IN_FLIGHT.labels(name)
+
+    async def __aenter__(self):
+        self.waiting += 1
+        self.waiting_gauge.inc()
+        start = time.perf_counter()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self.waiting_gauge.dec()
+        self.wait_seconds.observe(time.perf_counter() - start)
+        self.in_flight += 1
+        self.in_flight_gauge.inc()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self.in_flight_gauge.dec()
+        self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+        }
+
+
+def with_limiter(limiter: StageLimiter):
+    seconds = STAGE_SECONDS.labels(limiter.name)
+    errors = STAGE_ERRORS.labels(limiter.name)
+
+    def wrapper(f):
+        @functools.wraps(f)
+        async def wrapped(*args, **kwargs):
+            async with limiter:
+                start = time.perf_counter()
+                try:
+                    return await f(*args, **kwargs)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    seconds.observe(time.perf_counter() - start)
+
+        return wrapped
+
+    return wrapper
+
+
 if __name__ == "__main__":
     tmp_lock = asyncio.Lock()
 
@@ -26,11 +99,23 @@ if __name__ == "__main__":
         print(f"{context} ----> 3")
         await asyncio.sleep(1)
 
+    tmp_limiter = StageLimiter("probe", 2)
+
+    @with_limiter(tmp_limiter)
+    async def limited_probe(context: str):
+        print(f"{context} ----> {tmp_limiter.stats()}")
+        await asyncio.sleep(1)
+
     async def _run():
         await asyncio.gather(
             probe("FIRST"),
             probe("SECOND"),
             probe("THIRD"),
         )
+        await asyncio.gather(
+            limited_probe("FIRST"),
+            limited_probe("SECOND"),
+            limited_probe("THIRD"),
+        )
 
     asyncio.run(_run())
@@ -1,9 +1,200 @@
+import atexit
+import hashlib
 import logging
+import queue
+import random
+import re
+import sys
+import threading
+import typing as T
 
 from loguru import logger
 
+# only this much of a large value is hashed, enough to tell payloads apart
+HASHED_PREFIX = 64 * 1024
+# collections with more items are only described
+MAX_ITEMS = 32
+# text that is binary data in disguise: base64, possibly in a data url
+ENCODED = re.compile(
+    r"(data:[\w.+-]+/[\w.+-]+(;[\w.+-]+=[\w.+-]+)*;base64,)?[\w+/-]+=*"
+)
+
+# set up by configure, exported as metrics
+queue_sink: T.Optional["QueueSink"] = None
+sampler: T.Optional["Sampler"] = None
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
+    "<level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+
 
 class InterceptHandler(logging.Handler):
     def emit(self, record: logging.LogRecord) -> None:  # pragma: no cover
         logger_opt = logger.opt(depth=7, exception=record.exc_info)
         logger_opt.log(record.levelname, record.getMessage())
+
+
+def _digest(data: bytes, size: int, unit: str) -> str:
+    h = hashlib.sha256(data[:HASHED_PREFIX]).hexdigest()[:16]
+    return f"<{size} {unit} sha256:{h}>"
+
+
+def summarize(value: T.Any, max_length: int) -> T.Any:
+    """
+    A short stand-in for a log field: binary data, also when base64 encoded
+    or in a data url, is replaced by its size and hash, other long strings
+    and large collections are truncated.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _digest(bytes(value), len(value), "bytes")
+
+    if isinstance(value, str):
+        if len(value) <= max_length:
+            return value
+        if ENCODED.fullmatch(value[:max_length]):
+            return _digest(value.encode(), len(value), "chars")
+        return f"{value[:max_length]}...(+{len(value) - max_length} chars)"
+
+    if isinstance(value, (list, tuple, set, frozenset, dict)):
+        if len(value) > MAX_ITEMS:
+            return f"<{type(value).__name__} of {len(value)} items>"
+        text = repr(value)
+        if len(text) > max_length:
+            return f"{text[:max_length]}...(+{len(text) - max_length} chars)"
+
+    return value
+
+
+class Patcher(object):
+    def __init__(self, max_field_length: int, max_message_length: int):
+        """
+        Shrinks the fields and the message of every record before it is
+        formatted or queued.
+        """
+        self.max_field_length = max_field_length
+        self.max_message_length = max_message_length
+
+    def __call__(self, record: dict):
+        extra = record["extra"]
+        for key, value in extra.items():
+            extra[key] = summarize(value, self.max_field_length)
+
+        message = record["message"]
+        if len(message) > self.max_message_length:
+            record["message"] = (
+                f"{message[:self.max_message_length]}"
+                f"...(+{len(message) - self.max_message_length} chars)"
+            )
+
+
+class Sampler(object):
+    def __init__(self, rates: T.Dict[str, float]):
+        """
+        Keeps the given fraction of the records of each message, warnings
+        and errors are always kept.
+        """
+        self.rates = rates
+        self.sampled_out = 0
+
+    @staticmethod
+    def parse(spec: str) -> T.Dict[str, float]:
+        """
+        :param spec: "message=rate" pairs separated by commas
+        """
+        rates = {}
+        for pair in spec.split(","):
+            message, _, rate = pair.rpartition("=")
+            if message.strip():
+                rates[message.strip()] = float(rate)
+        return rates
+
+    def __call__(self, record: dict) -> bool:
+        rate = self.rates.get(record["message"])
+        if rate is None or record["level"].no >= logging.WARNING:
+            return True
+        if random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class QueueSink(object):
+    def __init__(self, stream: T.TextIO, maxsize: int):
+        """
+        Hands formatted records to a writer thread, so that logging never
+        waits on the stream. When the queue is full records are dropped and
+        counted instead.
+        """
+        self.stream = stream
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            self.stream.write(message)
+            if self.queue.empty():
+                self.stream.flush()
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+    def isatty(self) -> bool:
+        return self.stream.isatty()
+
+
+def _format(record: dict) -> str:
+    if record["extra"]:
+        return TEXT_FORMAT + " | {extra}\n{exception}"
+    return TEXT_FORMAT + "\n{exception}"
+
+
+def configure(
+    level: int,
+    serialize: bool = False,
+    max_field_length: int = 256,
+    max_message_length: int = 2048,
+    queue_size: int = 10000,
+    sampling: str = "",
+):
+    """
+    Route every loguru record through the patcher and the sampler to
+    stderr, through a QueueSink unless `queue_size` is 0. Structured fields
+    are shown after the message, or serialized with it as JSON.
+    """
+    global queue_sink, sampler
+
+    sink: T.Any = sys.stderr
+    if queue_size > 0:
+        sink = queue_sink = QueueSink(sys.stderr, queue_size)
+        atexit.register(sink.stop)
+    sampler = Sampler(Sampler.parse(sampling))
+
+    logger.configure(
+        handlers=[
+            {
+                "sink": sink,
+                "level": level,
+                "format": _format,
+                "filter": sampler,
+                "serialize": serialize,
+                "colorize": sys.stderr.isatty() and not serialize,
+            }
+        ],
+        patcher=Patcher(max_field_length, max_message_length),
+    )
@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# from cache lookups to image edits, in seconds
+BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    20.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "aie_stage_seconds",
+    "Time spent in a pipeline stage, retries included",
+    ["stage"],
+    buckets=BUCKETS,
+)
+STAGE_WAIT_SECONDS = Histogram(
+    "aie_stage_wait_seconds",
+    "Time spent waiting for a pipeline stage slot",
+    ["stage"],
+    buckets=BUCKETS,
+)
+STAGE_IN_FLIGHT = Gauge(
+    "aie_stage_in_flight", "Pipeline stage calls running", ["stage"]
+)
+STAGE_WAITING = Gauge(
+    "aie_stage_waiting", "Pipeline stage calls waiting for a slot", ["stage"]
+)
+STAGE_ERRORS = Counter(
+    "aie_stage_errors_total", "Pipeline stage calls that failed", ["stage"]
+)
+SCENE_SECONDS = Histogram(
+    "aie_scene_seconds",
+    "Time taken by a pipeline run",
+    ["outcome"],
+    buckets=BUCKETS,
+)
+RETRIES = Counter(
+    "aie_retries_total", "Failed attempts followed by a retry", ["function"]
+)
+RETRIES_EXHAUSTED = Counter(
+    "aie_retries_exhausted_total",
+    "Calls that failed after their last attempt",
+    ["function"],
+)
+ADMISSION_REJECTED = Counter(
+    "aie_admission_rejected_total", "Scenes refused by admission control"
+)
+
+DEPENDENCY_SECONDS = Histogram(
+    "aie_dependency_seconds",
+    "Time taken by a call to an external dependency",
+    ["dependency", "operation"],
+    buckets=BUCKETS,
+)
+DEPENDENCY_IN_FLIGHT = Gauge(
+    "aie_dependency_in_flight",
+    "Calls to an external dependency in progress",
+    ["dependency"],
+)
+DEPENDENCY_ERRORS = Counter(
+    "aie_dependency_errors_total",
+    "Calls to an external dependency that failed",
+    ["dependency", "operation"],
+)
+
+
+def observe(dependency: str, operation: str):
+    """
+    Time the calls of the wrapped coroutine and count them while in flight
+    and when they fail. Cancelled calls, such as the losers of a hedged
+    call, are left out of the latencies.
+    """
+
+    def wrapper(f):
+        seconds = DEPENDENCY_SECONDS.labels(dependency, operation)
+        errors = DEPENDENCY_ERRORS.labels(dependency, operation)
+        in_flight = DEPENDENCY_IN_FLIGHT.labels(dependency)
+
+        @functools.wraps(f)
+        async def wrapped(*args, **kwargs):
+            in_flight.inc()
+            start = time.perf_counter()
+            try:
+                res = await f(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                errors.inc()
+                seconds.observe(time.perf_counter() - start)
+                raise
+            else:
+                seconds.observe(time.perf_counter() - start)
+                return res
+            finally:
+                in_flight.dec()
+
+        return wrapped
+
+    return wrapper
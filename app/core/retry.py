@@ -1,32 +1,198 @@
 import asyncio
+import contextlib
 import functools
+import random
+import time
+import typing as T
 
+import httpx
+import openai
 from loguru import logger
 
+from core import tracing
+from core.metrics import RETRIES, RETRIES_EXHAUSTED
+
+# every circuit breaker registers itself here so that its state can be reported
+breakers: T.Dict[str, "CircuitBreaker"] = {}
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
 
 class TooManyAttempts(Exception):
     pass
 
 
-def with_retry(howmany: int, backoff: float):
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def _status_code(e: BaseException) -> T.Optional[int]:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code
+
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code
+
+    return None
+
+
+def retryable(e: BaseException) -> bool:
+    """
+    Whether another attempt may succeed. Requests rejected by the endpoint
+    as invalid won't, and neither will calls refused by an open circuit.
+    """
+    if isinstance(e, CircuitOpen):
+        return False
+
+    status_code = _status_code(e)
+    if status_code is not None:
+        return status_code >= 500 or status_code in (408, 429)
+
+    return True
+
+
+def endpoint_failure(e: BaseException) -> bool:
+    """
+    Whether the error is held against the endpoint by its circuit breaker.
+    """
+    if isinstance(e, (httpx.TransportError, openai.APIConnectionError)):
+        return True
+
+    status_code = _status_code(e)
+    return status_code is not None and status_code >= 500
+
+
+def with_retry(
+    howmany: int,
+    backoff: float,
+    max_backoff: float = 30.0,
+    retry_on: T.Callable[[BaseException], bool] = retryable,
+):
+    """
+    Retry the wrapped coroutine up to `howmany` times. The n-th retry waits
+    a random time up to `backoff` * 2 ** (n - 1) seconds, capped to
+    `max_backoff`, so that failing callers don't retry in lockstep.
+    """
+
     def wrapper(f):
+        retries = RETRIES.labels(f.__name__)
+        exhausted = RETRIES_EXHAUSTED.labels(f.__name__)
+
         @functools.wraps(f)
         async def wrapped(*args, **kwargs):
             for i in range(howmany):
                 try:
                     return await f(*args, **kwargs)
                 except Exception as e:
-                    logger.warning(f"call #{i+1} failed: {str(e)}")
-                    await asyncio.sleep(backoff)
-                    pass
-
-            raise TooManyAttempts()
+                    if not retry_on(e):
+                        raise
+
+                    logger.warning(
+                        "call failed", function=f.__name__, attempt=i + 1, error=str(e)
+                    )
+                    tracing.event("attempt failed", attempt=i + 1, error=repr(e))
+                    if i + 1 == howmany:
+                        exhausted.inc()
+                        raise TooManyAttempts(
+                            f"{howmany} attempts failed, last with: {e!r}"
+                        ) from e
+
+                    retries.inc()
+                    await asyncio.sleep(
+                        random.uniform(0, min(max_backoff, backoff * 2**i))
+                    )
 
         return wrapped
 
     return wrapper
 
 
+class CircuitBreaker(object):
+    def __init__(
+        self, name: str, failure_threshold: int = 5, reset_timeout: float = 30
+    ):
+        """
+        Opens after `failure_threshold` consecutive endpoint failures, then
+        refuses calls with CircuitOpen for `reset_timeout` seconds. After that
+        a single trial call is let through: it closes the circuit if it
+        succeeds and opens it again if it fails.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+        breakers[name] = self
+
+    def _check(self):
+        if self.state == CIRCUIT_CLOSED:
+            return
+
+        retry_after = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == CIRCUIT_OPEN and retry_after <= 0:
+            self.state = CIRCUIT_HALF_OPEN
+
+        if self.state == CIRCUIT_HALF_OPEN and not self.trial_running:
+            self.trial_running = True
+            return
+
+        self.rejected += 1
+        raise CircuitOpen(self.name, max(retry_after, 0.0))
+
+    def _open(self):
+        self.state = CIRCUIT_OPEN
+        self.opened_at = time.monotonic()
+        self.opened += 1
+        logger.warning("circuit opened", breaker=self.name)
+
+    @contextlib.asynccontextmanager
+    async def guard(self) -> T.AsyncIterator[None]:
+        """
+        :raise CircuitOpen: if the circuit doesn't let the call through
+        """
+        self._check()
+        trial = self.state == CIRCUIT_HALF_OPEN
+        try:
+            yield
+        except BaseException as e:
+            if endpoint_failure(e):
+                self.failures += 1
+                self.consecutive_failures += 1
+                if trial or self.consecutive_failures >= self.failure_threshold:
+                    self._open()
+            elif trial and not isinstance(e, asyncio.CancelledError):
+                self.state = CIRCUIT_CLOSED
+            raise
+        else:
+            self.consecutive_failures = 0
+            if trial:
+                self.state = CIRCUIT_CLOSED
+                logger.info("circuit closed", breaker=self.name)
+        finally:
+            if trial:
+                self.trial_running = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+
 if __name__ == "__main__":
 
     class Fallible(object):
@@ -56,4 +222,27 @@ if __name__ == "__main__":
 
     asyncio.run(will_succeed())
 
-    asyncio.run(will_fail())
+    try:
+        asyncio.run(will_fail())
+    except TooManyAttempts as e:
+        print(repr(e), "caused by", repr(e.__cause__))
+
+    breaker = CircuitBreaker("probe", 2, 0.2)
+
+    async def call(ok: bool):
+        async with breaker.guard():
+            if not ok:
+                raise httpx.ConnectError("down")
+
+    async def _run():
+        for ok in (False, False, True, "wait", True, True):
+            if ok == "wait":
+                await asyncio.sleep(0.25)
+                continue
+            try:
+                await call(ok)
+            except Exception as e:
+                print(repr(e))
+            print(breaker.stats())
+
+    asyncio.run(_run())
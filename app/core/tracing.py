@@ -0,0 +1,171 @@
+import contextlib
+import functools
+import json
+import typing as T
+
+from loguru import logger
+from opentelemetry import baggage, context, trace
+from opentelemetry.baggage.propagation import W3CBaggagePropagator
+from opentelemetry.propagators.composite import CompositePropagator
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace.propagation.tracecontext import (
+    TraceContextTextMapPropagator,
+)
+
+from core.config import (
+    TRACING_ENDPOINT,
+    TRACING_EXPORTER,
+    TRACING_FILE,
+    TRACING_SAMPLE_RATIO,
+)
+
+SCENE_ID = "scene.id"
+
+tracer = trace.get_tracer("aie")
+propagator = CompositePropagator(
+    [TraceContextTextMapPropagator(), W3CBaggagePropagator()]
+)
+
+
+class SceneSpanProcessor(SpanProcessor):
+    """
+    Stamps every span with the scene id carried by the baggage, if any.
+    """
+
+    def on_start(self, span, parent_context: T.Optional[context.Context] = None):
+        scene_id = baggage.get_baggage(SCENE_ID, parent_context)
+        if scene_id is not None:
+            span.set_attribute(SCENE_ID, scene_id)
+
+
+class FileSpanExporter(ConsoleSpanExporter):
+    def __init__(self, path: str):
+        """
+        Appends the spans to `path`, one JSON object per line. The file is
+        closed when the exporter shuts down.
+        """
+        super().__init__(
+            out=open(path, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+
+    def shutdown(self):
+        self.out.close()
+
+
+def _exporter(kind: str):
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        return OTLPSpanExporter(endpoint=TRACING_ENDPOINT)
+
+    if kind == "file":
+        return FileSpanExporter(TRACING_FILE)
+
+    raise ValueError(f"unknown tracing exporter {kind!r}")
+
+
+def setup(service_name: str):
+    """
+    Export the spans of this process as configured. While TRACING_EXPORTER
+    is "none" spans are not recorded at all.
+    """
+    if TRACING_EXPORTER == "none":
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(SceneSpanProcessor())
+    provider.add_span_processor(BatchSpanProcessor(_exporter(TRACING_EXPORTER)))
+    trace.set_tracer_provider(provider)
+    logger.info(
+        "tracing enabled",
+        exporter=TRACING_EXPORTER,
+        sample_ratio=TRACING_SAMPLE_RATIO,
+    )
+
+
+def shutdown():
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, TracerProvider):
+        provider.shutdown()
+
+
+def traced(name: str):
+    """
+    Run the wrapped coroutine in a span called `name`.
+    """
+
+    def wrapper(f):
+        @functools.wraps(f)
+        async def wrapped(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return await f(*args, **kwargs)
+
+        return wrapped
+
+    return wrapper
+
+
+def set_scene(scene_id: int):
+    trace.get_current_span().set_attribute(SCENE_ID, str(scene_id))
+
+
+@contextlib.contextmanager
+def scene_context(scene_id: int) -> T.Iterator[None]:
+    """
+    Every span started inside carries the scene id.
+    """
+    token = context.attach(baggage.set_baggage(SCENE_ID, str(scene_id)))
+    try:
+        yield
+    finally:
+        context.detach(token)
+
+
+@contextlib.contextmanager
+def continue_trace(
+    name: str,
+    carrier: T.Optional[str],
+    scene_id: int,
+    attributes: T.Optional[T.Dict[str, T.Any]] = None,
+) -> T.Iterator[None]:
+    """
+    Start a span for `scene_id` continuing the trace stored in `carrier` by
+    `inject`, typically in another process.
+    """
+    with tracer.start_as_current_span(
+        name,
+        context=extract(carrier),
+        kind=trace.SpanKind.CONSUMER,
+        attributes={**(attributes or {}), SCENE_ID: str(scene_id)},
+    ):
+        with scene_context(scene_id):
+            yield
+
+
+def event(name: str, **attributes):
+    trace.get_current_span().add_event(name, attributes)
+
+
+def inject() -> T.Optional[str]:
+    """
+    The current trace context, serialized to be stored along with a job.
+    """
+    carrier: T.Dict[str, str] = {}
+    propagator.inject(carrier)
+    return json.dumps(carrier) if carrier else None
+
+
+def extract(carrier: T.Optional[str]) -> context.Context:
+    """
+    The context to continue a trace stored by `inject` with.
+    """
+    return propagator.extract(json.loads(carrier) if carrier else {})
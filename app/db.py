@@ -1,12 +1,31 @@
+import random
 import typing as T
+from datetime import datetime, timedelta
 
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import and_, exists, func, literal, or_, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 
 from core.config import DATABASE_URL
-from models.db import Scene
+from models.db import (
+    Description,
+    DescriptionBand,
+    Scene,
+    SCENE_PENDING,
+    SCENE_DESCRIBED,
+    SCENE_PROMPTED,
+    SCENE_EDITED,
+    SCENE_FAILED,
+    Job,
+    JOB_ACTIVE,
+    JOB_PENDING,
+    JOB_RUNNING,
+    JOB_DONE,
+    JOB_FAILED,
+)
 
 engine = create_async_engine(DATABASE_URL, pool_recycle=300, pool_pre_ping=True)
 SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -23,13 +42,406 @@ async def update_scene(db: AsyncSession, scene: Scene):
     await db.commit()
 
 
+SCENE_STATUS_TIMESTAMPS = {
+    SCENE_DESCRIBED: "described_at",
+    SCENE_PROMPTED: "prompted_at",
+    SCENE_EDITED: "edited_at",
+    SCENE_FAILED: "failed_at",
+}
+
+
+def mark_scene(scene: Scene, status: str, error: T.Optional[str] = None):
+    """
+    Move the scene to `status` and stamp the matching stage timestamp.
+    The change is persisted by the next update_scene.
+    """
+    ts = datetime.now()
+    scene.status = status
+    scene.error = error
+    scene.modified_at = ts
+    if status in SCENE_STATUS_TIMESTAMPS:
+        setattr(scene, SCENE_STATUS_TIMESTAMPS[status], ts)
+
+
 async def get_scene(db: AsyncSession, scene_id: int) -> Scene:
     q = select(Scene).where(Scene.id == scene_id)
     res = await db.execute(q)
     return res.scalars().first()
 
 
-async def list_scenes(db: AsyncSession, limit: int) -> T.List[Scene]:
-    q = select(Scene).order_by(Scene.modified_at.desc()).limit(limit)
+# columns loaded when listing scenes in summary mode, leaving out the large
+# text columns
+SCENE_SUMMARY_COLUMNS = (
+    Scene.id,
+    Scene.email,
+    Scene.name,
+    Scene.created_at,
+    Scene.modified_at,
+    Scene.original_data,
+    Scene.result,
+    Scene.status,
+)
+
+
+async def list_scenes(
+    db: AsyncSession,
+    limit: int,
+    after: T.Optional[T.Tuple[datetime, int]] = None,
+    summary: bool = False,
+    status: T.Optional[str] = None,
+) -> T.List[Scene]:
+    """
+    List scenes from the most recently created, one page at a time.
+    `after` is the (created_at, id) of the last scene of the previous page.
+    Neither changes once the scene is stored, so scenes moving through the
+    pipeline during a listing are neither skipped nor listed twice.
+    The (created_at, id) index makes every page cost the same, and the
+    (status, created_at, id) one does the same when filtering by `status`.
+    In summary mode rows only carry SCENE_SUMMARY_COLUMNS.
+    """
+    q = select(*SCENE_SUMMARY_COLUMNS) if summary else select(Scene)
+    if status is not None:
+        q = q.where(Scene.status == status)
+    if after is not None:
+        q = q.where(tuple_(Scene.created_at, Scene.id) < tuple_(*after))
+    q = q.order_by(Scene.created_at.desc(), Scene.id.desc()).limit(limit)
     res = await db.execute(q)
+    if summary:
+        return list(res.fetchall())
     return [r[0] for r in res.fetchall()]
+
+
+async def find_scene_changes(
+    db: AsyncSession, after: T.Tuple[datetime, int], limit: int
+) -> T.List[T.Any]:
+    """
+    The (id, status, error, modified_at) of the scenes modified after the
+    (modified_at, id) `after`, oldest first.
+    """
+    q = (
+        select(Scene.id, Scene.status, Scene.error, Scene.modified_at)
+        .where(tuple_(Scene.modified_at, Scene.id) > tuple_(*after))
+        .order_by(Scene.modified_at, Scene.id)
+        .limit(limit)
+    )
+    res = await db.execute(q)
+    return list(res.fetchall())
+
+
+def encode_cursor(scene: Scene) -> str:
+    return f"{scene.created_at.isoformat()}_{scene.id}"
+
+
+def decode_cursor(cursor: str) -> T.Tuple[datetime, int]:
+    """
+    Raises ValueError when the cursor is malformed.
+    """
+    ts, _, scene_id = cursor.rpartition("_")
+    return datetime.fromisoformat(ts), int(scene_id)
+
+
+async def create_scene_job(
+    db: AsyncSession, scene: Scene, trace_context: T.Optional[str] = None
+) -> Job:
+    """
+    Insert the scene and its pipeline job in the same transaction, so that a
+    scene is never stored without being queued.
+    """
+    db.add(scene)
+    await db.flush()
+    job = Job(
+        scene_id=scene.id,
+        status=JOB_PENDING,
+        attempts=0,
+        created_at=datetime.now(),
+        trace_context=trace_context,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(scene)
+    await db.refresh(job)
+    return job
+
+
+async def count_jobs(db: AsyncSession) -> T.Dict[str, int]:
+    """
+    Number of pending and running jobs per status, for the statuses that have
+    any. Finished jobs are left out, the table keeps all of them.
+    """
+    q = (
+        select(Job.status, func.count())
+        .where(Job.status.in_((JOB_PENDING, JOB_RUNNING)))
+        .group_by(Job.status)
+    )
+    res = await db.execute(q)
+    return {status: count for status, count in res.all()}
+
+
+async def count_jobs_done(db: AsyncSession, since: datetime) -> int:
+    """
+    Number of jobs done since `since`.
+    """
+    q = select(func.count()).where(Job.status == JOB_DONE, Job.finished_at >= since)
+    res = await db.execute(q)
+    return res.scalar_one()
+
+
+async def get_job(db: AsyncSession, job_id: int) -> Job:
+    q = select(Job).where(Job.id == job_id)
+    res = await db.execute(q)
+    return res.scalars().first()
+
+
+async def _fail_abandoned_jobs(db: AsyncSession, expired: T.Any, max_attempts: int):
+    """
+    Fail the jobs whose worker died during their last attempt, along with
+    their scene, since no other worker will claim them.
+    """
+    q = (
+        select(Job)
+        .where(expired, Job.attempts >= max_attempts)
+        .with_for_update(skip_locked=True)
+    )
+    res = await db.execute(q)
+    jobs = res.scalars().all()
+    if not jobs:
+        return
+
+    now = datetime.now()
+    for job in jobs:
+        job.status = JOB_FAILED
+        job.error = "worker lost during the last attempt"
+        job.finished_at = now
+        scene = await get_scene(db, job.scene_id)
+        if scene is not None and scene.status not in (SCENE_EDITED, SCENE_FAILED):
+            mark_scene(scene, SCENE_FAILED, job.error)
+    await db.commit()
+
+
+async def claim_job(
+    db: AsyncSession, worker: str, visibility_timeout: int, max_attempts: int
+) -> T.Optional[Job]:
+    """
+    Claim the oldest runnable job: a pending one that is not backing off,
+    or one left running by a worker that sent no heartbeat for
+    `visibility_timeout` seconds, presumably dead.
+    SKIP LOCKED lets concurrent workers claim different rows without waiting;
+    on SQLite the locking clause is simply not emitted.
+    """
+    now = datetime.now()
+    expired = and_(
+        Job.status == JOB_RUNNING,
+        Job.heartbeat_at < now - timedelta(seconds=visibility_timeout),
+    )
+    await _fail_abandoned_jobs(db, expired, max_attempts)
+
+    q = (
+        select(Job)
+        .where(
+            or_(
+                and_(
+                    Job.status == JOB_PENDING,
+                    or_(Job.not_before.is_(None), Job.not_before <= now),
+                ),
+                and_(expired, Job.attempts < max_attempts),
+            ),
+        )
+        .order_by(Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    res = await db.execute(q)
+    job = res.scalars().first()
+    if job is None:
+        await db.rollback()
+        return None
+
+    job.status = JOB_RUNNING
+    job.attempts += 1
+    job.worker = worker
+    job.claimed_at = now
+    job.heartbeat_at = now
+    job.not_before = None
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def heartbeat_job(db: AsyncSession, job_id: int, worker: str) -> bool:
+    """
+    Tell the other workers that `worker` is still running the job. Returns
+    False when the job is no longer its own.
+    """
+    q = (
+        update(Job)
+        .where(Job.id == job_id, Job.worker == worker, Job.status == JOB_RUNNING)
+        .values(heartbeat_at=datetime.now())
+    )
+    res = await db.execute(q)
+    await db.commit()
+    return res.rowcount > 0
+
+
+async def complete_job(db: AsyncSession, job: Job):
+    job.status = JOB_DONE
+    job.error = None
+    job.finished_at = datetime.now()
+    await db.commit()
+
+
+async def release_job(db: AsyncSession, job: Job, delay: float = 0):
+    """
+    Put a claimed job back in the queue without counting the attempt, to be
+    claimed again after `delay` seconds.
+    """
+    job.status = JOB_PENDING
+    job.attempts -= 1
+    job.worker = None
+    job.claimed_at = None
+    job.heartbeat_at = None
+    job.not_before = datetime.now() + timedelta(seconds=delay) if delay else None
+    await db.commit()
+
+
+async def fail_job(
+    db: AsyncSession,
+    job: Job,
+    error: str,
+    max_attempts: int,
+    backoff: float = 0,
+    max_backoff: float = 3600,
+):
+    """
+    Record a failed attempt. Until it runs out of attempts the job is queued
+    again, and claimed after a random delay between half and all of
+    `backoff` * 2 ** (attempts - 1) seconds, capped to `max_backoff`.
+    """
+    now = datetime.now()
+    job.error = error
+    job.worker = None
+    job.heartbeat_at = None
+    if job.attempts >= max_attempts:
+        job.status = JOB_FAILED
+        job.finished_at = now
+        await db.commit()
+        return
+
+    delay = min(max_backoff, backoff * 2 ** (job.attempts - 1))
+    job.status = JOB_PENDING
+    job.not_before = now + timedelta(seconds=random.uniform(delay / 2, delay))
+    await db.commit()
+
+
+async def enqueue_interrupted_scenes(db: AsyncSession) -> T.List[int]:
+    """
+    Queue a job for every scene that the pipeline didn't bring to completion
+    and that has no pending or running job left to do it, in one statement.
+    The unique index on the active job of a scene makes concurrent calls
+    queue each scene once, the losers' rows being skipped on conflict.
+    """
+    active_job = exists().where(
+        Job.scene_id == Scene.id, Job.status.in_((JOB_PENDING, JOB_RUNNING))
+    )
+    interrupted = select(
+        Scene.id, literal(JOB_PENDING), literal(0), literal(datetime.now())
+    ).where(
+        Scene.status.in_((SCENE_PENDING, SCENE_DESCRIBED, SCENE_PROMPTED)),
+        ~active_job,
+    )
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    q = (
+        dialect.insert(Job)
+        .from_select(["scene_id", "status", "attempts", "created_at"], interrupted)
+        .on_conflict_do_nothing(index_elements=["scene_id"], index_where=JOB_ACTIVE)
+        .returning(Job.scene_id)
+    )
+    res = await db.execute(q)
+    scene_ids = sorted(res.scalars().all())
+    await db.commit()
+    return scene_ids
+
+
+async def find_scene_by_hash(db: AsyncSession, content_hash: str) -> T.Optional[Scene]:
+    q = (
+        select(Scene)
+        .where(Scene.content_hash == content_hash)
+        .order_by(Scene.id)
+        .limit(1)
+    )
+    res = await db.execute(q)
+    return res.scalars().first()
+
+
+async def find_duplicate_in_flight(db: AsyncSession, scene: Scene) -> T.Optional[Scene]:
+    """
+    The oldest scene with the same upload that was created before this one
+    and still has a job queued or running. Only older scenes are waited for,
+    so two duplicates never wait for each other.
+    """
+    active_job = exists().where(
+        Job.scene_id == Scene.id, Job.status.in_((JOB_PENDING, JOB_RUNNING))
+    )
+    q = (
+        select(Scene)
+        .where(
+            Scene.content_hash == scene.content_hash,
+            Scene.id < scene.id,
+            Scene.result.is_(None),
+            active_job,
+        )
+        .order_by(Scene.id)
+        .limit(1)
+    )
+    res = await db.execute(q)
+    return res.scalars().first()
+
+
+async def find_processed_duplicate(db: AsyncSession, scene: Scene) -> T.Optional[Scene]:
+    """
+    Another scene with the same upload that went at least through the
+    describe stage, preferring one that went through the whole pipeline.
+    """
+    q = (
+        select(Scene)
+        .where(
+            Scene.content_hash == scene.content_hash,
+            Scene.id != scene.id,
+            Scene.description.is_not(None),
+        )
+        .order_by(Scene.result.is_(None), Scene.edit_prompt.is_(None), Scene.id.desc())
+        .limit(1)
+    )
+    res = await db.execute(q)
+    return res.scalars().first()
+
+
+async def find_descriptions_by_bands(
+    db: AsyncSession, bands: T.List[int]
+) -> T.List[Description]:
+    q = (
+        select(Description)
+        .join(DescriptionBand, DescriptionBand.description_id == Description.id)
+        .where(
+            or_(
+                *[
+                    and_(DescriptionBand.band == i, DescriptionBand.value == value)
+                    for i, value in enumerate(bands)
+                ]
+            )
+        )
+        .distinct()
+    )
+    res = await db.execute(q)
+    return list(res.scalars().all())
+
+
+async def create_description(
+    db: AsyncSession, phash: str, bands: T.List[int], description: str
+) -> Description:
+    row = Description(phash=phash, description=description, created_at=datetime.now())
+    db.add(row)
+    await db.flush()
+    for i, value in enumerate(bands):
+        db.add(DescriptionBand(band=i, value=value, description_id=row.id))
+    await db.commit()
+    return row
@@ -1,26 +1,40 @@
+import functools
+import time
+
 from PIL import Image
 from io import BytesIO
-import base64
+from loguru import logger
+
+from core import executor, tracing
+from core.config import IMAGE_EXECUTOR
+from core.metrics import observe
 
+FRAME_PATH = "static/frame.png"
 
-def frame(frame_path: str, image: str) -> str:
+
+@functools.lru_cache(maxsize=4)
+def load_border(frame_path: str) -> Image.Image:
     """
-    Superimpose a picture inside a border frame.
-    
-    :param border_path: Path to the border image (your uploaded frame)
-    :param picture_path: Path to the picture to insert
-    :param output_path: Path to save the result
+    Open and convert the border frame once per process. Callers must not
+    modify the returned image, it is shared.
     """
-    # Open border and picture
     border = Image.open(frame_path).convert("RGBA")
+    border.load()
+    return border
 
-    # Decode base64 string to bytes
-    image_data = base64.b64decode(image)
-    # Convert to a BytesIO stream
-    image_bytes = BytesIO(image_data)
 
-    # Open image with Pillow
-    img = Image.open(image_bytes).convert("RGBA")
+def frame(frame_path: str, image: bytes) -> bytes:
+    """
+    Superimpose a picture inside a border frame.
+
+    :param frame_path: Path to the border image (your uploaded frame)
+    :param image: encoded picture to insert
+    :return: PNG bytes of the framed picture
+    """
+    border = load_border(frame_path)
+
+    # Open image with Pillow, BytesIO shares the buffer of `image`
+    img = Image.open(BytesIO(image)).convert("RGBA")
 
     # Resize picture to fit inside border (with some margin)
     border_w, border_h = border.size
@@ -37,13 +51,29 @@ def frame(frame_path: str, image: str) -> str:
 
     framed_bytes = BytesIO()
     border_copy.save(framed_bytes, format="PNG")
-    framed_bytes.seek(0)
 
-    # Save result
-    return base64.b64encode(framed_bytes.read()).decode()
+    return framed_bytes.getvalue()
+
+
+@tracing.traced("framer.frame")
+@observe("framer", "frame")
+async def frame_async(image: bytes, frame_path: str = FRAME_PATH) -> bytes:
+    """
+    Run `frame` in the image executor, off the event loop.
+    """
+    start = time.perf_counter()
+    res = await executor.run(frame, frame_path, image)
+    logger.info(
+        "image framed",
+        executor=IMAGE_EXECUTOR,
+        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+    return res
+
 
 if __name__ == "__main__":
     import argparse
+    import sys
 
     parser = argparse.ArgumentParser()
     parser.add_argument("frame_path")
@@ -51,8 +81,7 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    with open(args.image_path) as img:
+    with open(args.image_path, "rb") as img:
         image = frame(args.frame_path, img.read())
 
-    print(image)
-
+    sys.stdout.buffer.write(image)
@@ -1,12 +1,14 @@
-import base64
 import os.path
+import typing as T
 from pathlib import Path
 from uuid import uuid4
 
 import aiofiles
 from loguru import logger
 
+from core import digest, tracing
 from core.config import LOCAL_PATH
+from core.metrics import observe
 
 
 class LocalStorage(object):
@@ -16,17 +18,50 @@ class LocalStorage(object):
         """
         self.directory = Path(directory)
 
-    async def save(self, content: str) -> str:
+    @tracing.traced("storage.save")
+    @observe("storage", "save")
+    async def save(self, content: bytes, content_type: T.Optional[str] = None) -> str:
         """
-        The function expects a base64-encoded image to be saved to a local path.
+        The function expects the raw bytes of an image to be saved to a local
+        path. The name is the SHA-256 of the content, an existing file is kept.
+        """
+        fpath = os.path.join(self.directory, await digest.sha256(content))
+        if os.path.exists(fpath):
+            logger.debug("File already saved", path=fpath)
+            return fpath
+
+        logger.debug("Saving file", path=fpath)
+        # written aside then renamed, a partial file never takes the name
+        tmp_path = f"{fpath}.{uuid4()}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(content)
+        os.replace(tmp_path, fpath)
+
+        return fpath
+
+    @tracing.traced("storage.save_stream")
+    @observe("storage", "save_stream")
+    async def save_stream(
+        self,
+        chunks: T.AsyncIterator[bytes],
+        content_type: str = "application/octet-stream",
+    ) -> str:
+        """
+        Same as `save`, writing the chunks to disk as they arrive.
         The name is a randomly generated UUIDv4.
         """
         rand_id = str(uuid4())
         fpath = os.path.join(self.directory, rand_id)
         logger.debug("Saving file", path=fpath)
-        decoded = base64.b64decode(content)
+        size = 0
         async with aiofiles.open(fpath, "wb") as f:
-            await f.write(decoded)
+            async for chunk in chunks:
+                size += len(chunk)
+                await f.write(chunk)
+
+        if size == 0:
+            os.remove(fpath)
+            raise ValueError("Empty upload")
 
         return fpath
 
@@ -0,0 +1,127 @@
+from io import BytesIO
+import time
+
+from PIL import Image, ImageOps
+from loguru import logger
+
+from core import executor
+from core.config import (
+    INGEST_FORMAT,
+    INGEST_MAX_HEIGHT,
+    INGEST_MAX_WIDTH,
+    INGEST_QUALITY,
+)
+
+CONTENT_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+
+def normalize(
+    image: bytes | str,
+    max_width: int,
+    max_height: int,
+    fmt: str,
+    quality: int,
+) -> bytes:
+    """
+    Prepare an uploaded picture for storage and for the models.
+
+    :param image: encoded picture, or the path of a file holding it
+    :param max_width: the picture is downscaled to fit max_width x max_height
+    :param max_height: see max_width
+    :param fmt: output format, as understood by Pillow (JPEG, WEBP, PNG)
+    :param quality: encoder quality for lossy formats
+    :return: the re-encoded picture, upright and without metadata
+    """
+    with Image.open(BytesIO(image) if isinstance(image, bytes) else image) as img:
+        # let the JPEG decoder downscale while decoding, the orientation is
+        # not known yet so either side may end up being the width
+        longest = max(max_width, max_height)
+        img.draft("RGB", (longest, longest))
+
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+
+        if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        # nothing from the original info (exif, icc, xmp) is passed to save
+        out = BytesIO()
+        img.save(out, format=fmt, quality=quality)
+
+    return out.getvalue()
+
+
+async def normalize_async(image: bytes | str) -> bytes:
+    """
+    Run `normalize` with the configured settings in the image executor.
+    """
+    start = time.perf_counter()
+    res = await executor.run(
+        normalize,
+        image,
+        INGEST_MAX_WIDTH,
+        INGEST_MAX_HEIGHT,
+        INGEST_FORMAT,
+        INGEST_QUALITY,
+    )
+    logger.info(
+        "image normalized",
+        size=len(res),
+        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+    return res
+
+
+def phash(image: bytes | str, size: int = 8) -> str:
+    """
+    Perceptual difference hash (dHash) of a picture: near-identical pictures
+    get hashes that differ by a few bits.
+
+    :param image: encoded picture, or the path of a file holding it
+    :param size: the hash has size * size bits
+    :return: the hash, as a hex string
+    """
+    with Image.open(BytesIO(image) if isinstance(image, bytes) else image) as img:
+        img.draft("L", (size + 1, size))
+        small = img.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS)
+
+    px = small.tobytes()
+    bits = 0
+    for y in range(size):
+        row = px[y * (size + 1) : (y + 1) * (size + 1)]
+        for x in range(size):
+            bits = (bits << 1) | (row[x] < row[x + 1])
+
+    return f"{bits:0{size * size // 4}x}"
+
+
+async def phash_async(image: bytes | str) -> str:
+    return await executor.run(phash, image)
+
+
+def content_type() -> str:
+    return CONTENT_TYPES.get(INGEST_FORMAT, "application/octet-stream")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image_path")
+    parser.add_argument("--max-width", type=int, default=INGEST_MAX_WIDTH)
+    parser.add_argument("--max-height", type=int, default=INGEST_MAX_HEIGHT)
+    parser.add_argument("--format", default=INGEST_FORMAT)
+    parser.add_argument("--quality", type=int, default=INGEST_QUALITY)
+
+    args = parser.parse_args()
+
+    image = normalize(
+        args.image_path, args.max_width, args.max_height, args.format, args.quality
+    )
+
+    sys.stdout.buffer.write(image)
@@ -1,11 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from api.routes.api import router as api_router
-from core.config import API_PREFIX, DEBUG, PROJECT_NAME, VERSION
+from api.routes.metrics import router as metrics_router
+from core import executor, tracing
+from core.config import API_PREFIX, DEBUG, EMBEDDED_WORKER, PROJECT_NAME, VERSION
 from fastapi import FastAPI
+from s3 import storage
+from services.imageeditor import image_editor
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    tracing.setup("aie-api")
+
+    worker_task = None
+    if EMBEDDED_WORKER:
+        from worker import get_worker
+
+        worker = get_worker()
+        worker_task = asyncio.create_task(worker.run())
+
+    yield
+
+    if worker_task is not None:
+        worker.stop()
+        await worker_task
+
+    await image_editor.close()
+    await storage.close()
+    await executor.shutdown()
+    tracing.shutdown()
 
 
 def get_application() -> FastAPI:
-    application = FastAPI(title=PROJECT_NAME, debug=DEBUG, version=VERSION)
+    application = FastAPI(
+        title=PROJECT_NAME, debug=DEBUG, version=VERSION, lifespan=lifespan
+    )
     application.include_router(api_router, prefix=API_PREFIX)
+    application.include_router(metrics_router)
     return application
 
 
@@ -1,7 +1,9 @@
+import asyncio
 from datetime import datetime
 from sys import orig_argv
 import typing as T
 from s3 import storage
+from core.config import LIST_URL_FANOUT
 
 from pydantic import BaseModel
 
@@ -24,21 +26,30 @@ class SceneOutput(BaseModel):
     description: str | None
     edit_prompt: str | None
     result: str | None
+    status: str | None
+    error: str | None
 
     @staticmethod
-    async def from_db(scene: db.Scene) -> "SceneOutput":
-        output = SceneOutput(
+    def _from_db(scene: db.Scene) -> "SceneOutput":
+        # summary rows from db.list_scenes don't carry the large text columns
+        return SceneOutput(
             id=scene.id,
             email=scene.email,
             name=scene.name,
             fpath="",
             created_at=scene.created_at,
             modified_at=scene.modified_at,
-            description=scene.description,
-            edit_prompt=scene.edit_prompt,
+            description=getattr(scene, "description", None),
+            edit_prompt=getattr(scene, "edit_prompt", None),
             result="",
+            status=scene.status,
+            error=getattr(scene, "error", None),
         )
-        
+
+    @staticmethod
+    async def from_db(scene: db.Scene) -> "SceneOutput":
+        output = SceneOutput._from_db(scene)
+
         if scene.original_data is not None and len(scene.original_data) != 0:
             output.fpath = await storage.get_presigned_url(scene.original_data)
 
@@ -46,3 +57,39 @@ class SceneOutput(BaseModel):
             output.result = await storage.get_presigned_url(scene.result)
 
         return output
+
+    @staticmethod
+    async def from_db_many(
+        scenes: T.List[db.Scene], fanout: int = LIST_URL_FANOUT
+    ) -> T.List["SceneOutput"]:
+        """
+        Serialize a page of scenes, signing all of their urls concurrently
+        with at most `fanout` signing calls in flight.
+        """
+        sem = asyncio.Semaphore(fanout)
+
+        async def sign(output: "SceneOutput", field: str, obj_url: str):
+            async with sem:
+                setattr(output, field, await storage.get_presigned_url(obj_url))
+
+        outputs = []
+        calls = []
+        for scene in scenes:
+            output = SceneOutput._from_db(scene)
+            outputs.append(output)
+            if scene.original_data is not None and len(scene.original_data) != 0:
+                calls.append(sign(output, "fpath", scene.original_data))
+            if scene.result is not None and len(scene.result) != 0:
+                calls.append(sign(output, "result", scene.result))
+
+        await asyncio.gather(*calls)
+        return outputs
+
+
+class BacklogOutput(BaseModel):
+    pending: int
+    running: int
+    backlog: int
+    # seconds until a scene submitted now starts being processed, if known
+    estimated_wait: float | None
+    accepting: bool
@@ -1,12 +1,32 @@
-from sqlalchemy import Column, Integer, Text, DateTime
+from sqlalchemy import Column, ForeignKey, Index, Integer, Text, DateTime, text
 from sqlalchemy.orm import declarative_base
 
 
 Base = declarative_base()
 
 
+SCENE_PENDING = "pending"
+SCENE_DESCRIBED = "described"
+SCENE_PROMPTED = "prompted"
+SCENE_EDITED = "edited"
+SCENE_FAILED = "failed"
+
+SCENE_STATUSES = (
+    SCENE_PENDING,
+    SCENE_DESCRIBED,
+    SCENE_PROMPTED,
+    SCENE_EDITED,
+    SCENE_FAILED,
+)
+
+
 class Scene(Base):
     __tablename__ = "scenes"
+    __table_args__ = (
+        Index("ix_scenes_modified_at_id", "modified_at", "id"),
+        Index("ix_scenes_created_at_id", "created_at", "id"),
+        Index("ix_scenes_status_created_at_id", "status", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(Text, index=True, nullable=False)
@@ -14,6 +34,80 @@ class Scene(Base):
     created_at = Column(DateTime, nullable=False)
     modified_at = Column(DateTime, nullable=False)
     original_data = Column(Text, nullable=False)
+    source_data = Column(Text)
+    content_hash = Column(Text, index=True)
+    phash = Column(Text)
     description = Column(Text)
     edit_prompt = Column(Text)
     result = Column(Text)
+    status = Column(Text, nullable=False, default=SCENE_PENDING)
+    error = Column(Text)
+    described_at = Column(DateTime)
+    prompted_at = Column(DateTime)
+    edited_at = Column(DateTime)
+    failed_at = Column(DateTime)
+
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# a scene has at most one job in these statuses
+JOB_ACTIVE = text("status IN ('pending', 'running')")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_id", "status", "id"),
+        Index("ix_jobs_status_finished_at", "status", "finished_at"),
+        Index(
+            "uq_jobs_active_scene_id",
+            "scene_id",
+            unique=True,
+            postgresql_where=JOB_ACTIVE,
+            sqlite_where=JOB_ACTIVE,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    scene_id = Column(Integer, ForeignKey("scenes.id"), index=True, nullable=False)
+    status = Column(Text, nullable=False, default=JOB_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    claimed_at = Column(DateTime)
+    # refreshed by the worker while it runs the job
+    heartbeat_at = Column(DateTime)
+    # a failed attempt is retried no sooner than this
+    not_before = Column(DateTime)
+    finished_at = Column(DateTime)
+    # trace context of the request that queued the job
+    trace_context = Column(Text)
+
+
+class Description(Base):
+    __tablename__ = "descriptions"
+
+    id = Column(Integer, primary_key=True)
+    phash = Column(Text, nullable=False)
+    description = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+class DescriptionBand(Base):
+    """
+    One 8-bit slice of a description's perceptual hash. Two hashes within
+    Hamming distance 7 share at least one slice, so near-duplicates can be
+    found with an index lookup.
+    """
+
+    __tablename__ = "description_bands"
+
+    band = Column(Integer, primary_key=True)
+    value = Column(Integer, primary_key=True)
+    description_id = Column(
+        Integer, ForeignKey("descriptions.id"), primary_key=True, nullable=False
+    )
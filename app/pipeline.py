@@ -1,68 +1,250 @@
-import asyncio
+from datetime import datetime
+import time
 
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.lock import with_lock
-from core.retry import with_retry
+from core.config import (
+    DESCRIBE_CONCURRENCY,
+    PROMPT_CONCURRENCY,
+    EDIT_CONCURRENCY,
+    JOB_DUPLICATE_DELAY,
+    PIPELINE_FUSED,
+)
+from core import tracing
+from core.events import bus
+from core.lock import StageLimiter, with_limiter
+from core.metrics import SCENE_SECONDS
+from core.retry import CircuitOpen, with_retry
 import db
 import framer
+import progress
 from s3 import storage
-from models.db import Scene
-from services.describer import describer
-from services.prompter import prompter
+from models.db import (
+    Scene,
+    SCENE_DESCRIBED,
+    SCENE_PROMPTED,
+    SCENE_EDITED,
+    SCENE_FAILED,
+)
+from services.describer import InvalidOutput
+from services.descriptions import descriptions
+from services.prompter import description_key, prompter
 from services.imageeditor import image_editor
 
 
-step_describe_lock = asyncio.Lock()
-step_prompt_lock = asyncio.Lock()
-step_edit_lock = asyncio.Lock()
+step_describe_limiter = StageLimiter("describe", DESCRIBE_CONCURRENCY)
+step_prompt_limiter = StageLimiter("prompt", PROMPT_CONCURRENCY)
+step_edit_limiter = StageLimiter("edit", EDIT_CONCURRENCY)
 
+limiters = [step_describe_limiter, step_prompt_limiter, step_edit_limiter]
 
-@with_lock(step_describe_lock)
+
+class DuplicateInFlight(Exception):
+    def __init__(self, duplicate_id: int, retry_after: float):
+        super().__init__(f"duplicate of scene {duplicate_id} in progress")
+        self.duplicate_id = duplicate_id
+        self.retry_after = retry_after
+
+
+async def _save(session: AsyncSession, scene: Scene):
+    """
+    Persist the scene, then tell the subscribers about its status.
+    """
+    event = progress.scene_event(scene)
+    await db.update_scene(session, scene)
+    bus.publish(event)
+
+
+@tracing.traced("step_reuse")
+async def step_reuse(session: AsyncSession, scene: Scene) -> Scene:
+    """
+    Copy whatever an identical upload already went through, the steps that
+    follow then skip the stages that were reused. While an older identical
+    upload is still being processed, DuplicateInFlight is raised to come
+    back once it is done rather than calling the models a second time.
+    """
+    scene = await db.get_scene(session, scene.id)
+    if not scene.content_hash or scene.result:
+        return scene
+
+    duplicate = await db.find_processed_duplicate(session, scene)
+    if duplicate is None or duplicate.result is None:
+        in_flight = await db.find_duplicate_in_flight(session, scene)
+        if in_flight is not None:
+            raise DuplicateInFlight(in_flight.id, JOB_DUPLICATE_DELAY)
+    if duplicate is None:
+        return scene
+
+    for field in ("description", "edit_prompt", "result"):
+        if getattr(scene, field) is None:
+            setattr(scene, field, getattr(duplicate, field))
+
+    if scene.result:
+        db.mark_scene(scene, SCENE_EDITED)
+    elif scene.edit_prompt:
+        db.mark_scene(scene, SCENE_PROMPTED)
+    else:
+        db.mark_scene(scene, SCENE_DESCRIBED)
+
+    logger.info("reusing duplicate scene", scene_id=scene.id, duplicate_id=duplicate.id)
+    await _save(session, scene)
+    await session.refresh(scene)
+    return scene
+
+
+@tracing.traced("step_describe")
+@with_limiter(step_describe_limiter)
 @with_retry(3, 1)
 async def step_describe(session: AsyncSession, scene: Scene, url: str) -> Scene:
     scene = await db.get_scene(session, scene.id)
-    description = await describer.run(url)
+    if scene.description:
+        logger.info("description already available", scene_id=scene.id)
+        return scene
+
+    description = await descriptions.run(url, scene.phash)
     logger.info("description returned", description=description)
     scene.description = description
-    await db.update_scene(session, scene)
+    db.mark_scene(scene, SCENE_DESCRIBED)
+    await _save(session, scene)
+    return scene
+
+
+@tracing.traced("step_describe_prompt")
+@with_limiter(step_describe_limiter)
+@with_retry(3, 1)
+async def step_describe_prompt(session: AsyncSession, scene: Scene, url: str) -> Scene:
+    """
+    Describe the scene and prepare its edit prompt with a single describer
+    call, made only when the description cache misses. When the answer
+    doesn't validate, or the description came from the cache, only the
+    description is kept and step_prompt then prepares the prompt as usual.
+    """
+    scene = await db.get_scene(session, scene.id)
+    if scene.description:
+        logger.info("description already available", scene_id=scene.id)
+        return scene
+
+    prompts = {}
+
+    async def describe_and_prompt(url: str) -> str:
+        description, prompt = await descriptions.describer.describe_and_prompt(url)
+        logger.info("description and prompt returned", description=description)
+        # scenes sharing this description find its prompt in the cache
+        if prompter.cache is not None:
+            prompter.cache.set(description_key(description), prompt)
+        prompts[description] = prompt
+        return description
+
+    try:
+        description = await descriptions.run(url, scene.phash, describe_and_prompt)
+    except InvalidOutput as e:
+        logger.warning("fused answer rejected", scene_id=scene.id, reason=str(e))
+        description = await descriptions.run(url, scene.phash)
+
+    scene.description = description
+    db.mark_scene(scene, SCENE_DESCRIBED)
+    if description in prompts:
+        scene.edit_prompt = prompts[description]
+        db.mark_scene(scene, SCENE_PROMPTED)
+    await _save(session, scene)
     return scene
 
 
-@with_lock(step_prompt_lock)
+@tracing.traced("step_prompt")
+@with_limiter(step_prompt_limiter)
 @with_retry(3, 1)
 async def step_prompt(session: AsyncSession, scene: Scene) -> Scene:
     await session.refresh(scene)
+    if scene.edit_prompt:
+        logger.info("prompt already available", scene_id=scene.id)
+        return scene
+
     prompt = await prompter.run(scene.description)
     logger.info("prompt prepared", prompt=prompt)
     scene.edit_prompt = prompt
-    await db.update_scene(session, scene)
+    db.mark_scene(scene, SCENE_PROMPTED)
+    await _save(session, scene)
     return scene
 
 
-@with_lock(step_edit_lock)
+@tracing.traced("step_edit")
+@with_limiter(step_edit_limiter)
 @with_retry(3, 1)
 async def step_edit(session: AsyncSession, scene: Scene, url: str) -> Scene:
     await session.refresh(scene)
+    if scene.result:
+        logger.info("result already available", scene_id=scene.id)
+        return scene
+
     image = await image_editor.run(url, scene.edit_prompt)
-    logger.info("image edited", image=image)
+    logger.info("image edited", scene_id=scene.id, size=len(image))
 
-    framed_image = framer.frame("static/frame.png", image)
+    framed_image = await framer.frame_async(image)
 
     result_url = await storage.save(framed_image)
     scene.result = result_url
-    await db.update_scene(session, scene)
+    db.mark_scene(scene, SCENE_EDITED)
+    await _save(session, scene)
     return scene
 
 
-async def pipeline(scene: Scene):
+def stats() -> dict:
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+async def _fail(session: AsyncSession, scene_id: int, error: Exception, final: bool):
+    """
+    Record the error on the scene. It is only marked as failed when `final`,
+    otherwise it keeps its status until the attempt that follows.
+    """
+    try:
+        await session.rollback()
+        scene = await db.get_scene(session, scene_id)
+        message = str(error) or type(error).__name__
+        if final:
+            db.mark_scene(scene, SCENE_FAILED, message)
+        else:
+            scene.error = message
+            scene.modified_at = datetime.now()
+        await _save(session, scene)
+    except Exception:
+        logger.exception("failed to record the scene error", scene_id=scene_id)
+
+
+@tracing.traced("pipeline")
+async def pipeline(scene: Scene, final: bool = True):
+    """
+    Every step is skipped when its output is already stored, so running the
+    pipeline again for an interrupted scene resumes it from its last
+    completed stage.
+
+    :param final: whether this is the last attempt, the scene is only marked
+        as failed by the last one
+    """
+    scene_id = scene.id
+    start = time.perf_counter()
     async with db.SessionLocal() as session:
         try:
+            scene = await step_reuse(session, scene)
             url = await storage.get_presigned_url(scene.original_data)
-            scene = await step_describe(session, scene, url)
+            if PIPELINE_FUSED:
+                scene = await step_describe_prompt(session, scene, url)
+            else:
+                scene = await step_describe(session, scene, url)
             scene = await step_prompt(session, scene)
             scene = await step_edit(session, scene, url)
 
-        except Exception:
-            logger.exception("failed to run the pipeline", scene_id=scene.id)
+        except (CircuitOpen, DuplicateInFlight) as e:
+            # the scene keeps its progress and is picked up again later
+            logger.warning("pipeline paused", scene_id=scene_id, reason=str(e))
+            SCENE_SECONDS.labels("paused").observe(time.perf_counter() - start)
+            raise
+
+        except Exception as e:
+            logger.exception("failed to run the pipeline", scene_id=scene_id)
+            await _fail(session, scene_id, e, final)
+            SCENE_SECONDS.labels("failed").observe(time.perf_counter() - start)
+            raise
+
+    SCENE_SECONDS.labels("done").observe(time.perf_counter() - start)
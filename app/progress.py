@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timedelta
+import json
+import typing as T
+
+from loguru import logger
+
+import db
+from core.config import PROGRESS_HEARTBEAT, PROGRESS_LOOKBACK, PROGRESS_POLL_INTERVAL
+from core.events import EventBus, bus
+from models.db import SCENE_EDITED, SCENE_FAILED
+
+# a scene stream ends once its scene reaches one of these
+FINAL_STATUSES = (SCENE_EDITED, SCENE_FAILED)
+
+
+def scene_event(scene: T.Any) -> dict:
+    """
+    :param scene: a Scene, or a row with its id, status, error and modified_at
+    """
+    return {
+        "scene_id": scene.id,
+        "status": scene.status,
+        "error": scene.error,
+        "modified_at": scene.modified_at.isoformat() if scene.modified_at else None,
+    }
+
+
+class SceneWatcher(object):
+    def __init__(
+        self, bus: EventBus, interval: float, lookback: float, batch: int = 500
+    ):
+        """
+        Publishes the scene changes made by other processes, such as
+        standalone workers. A single query every `interval` seconds serves all
+        the subscribers, and nothing runs while there are none.
+
+        A change can commit after changes with a later modified_at, so every
+        query starts `lookback` seconds before the latest change seen; the bus
+        drops the changes it already published.
+        """
+        self.bus = bus
+        self.interval = interval
+        self.lookback = timedelta(seconds=lookback)
+        self.batch = batch
+        self.task: T.Optional[asyncio.Task] = None
+
+    def ensure_started(self):
+        if self.interval <= 0 or (self.task is not None and not self.task.done()):
+            return
+
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        latest = datetime.now()
+        after = (latest - self.lookback, 0)
+        while self.bus.subscriber_count() > 0:
+            try:
+                async with db.SessionLocal() as session:
+                    rows = await db.find_scene_changes(session, after, self.batch)
+            except Exception:
+                logger.exception("failed to look for scene changes")
+                rows = []
+
+            for row in rows:
+                self.bus.publish(scene_event(row))
+                after = (row.modified_at, row.id)
+                latest = max(latest, row.modified_at)
+
+            if len(rows) < self.batch:
+                await asyncio.sleep(self.interval)
+                after = (latest - self.lookback, 0)
+
+
+watcher = SceneWatcher(bus, PROGRESS_POLL_INTERVAL, PROGRESS_LOOKBACK)
+
+
+def _format(event: dict) -> str:
+    return f"event: {event['status']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(
+    scene_id: T.Optional[int] = None, heartbeat: float = PROGRESS_HEARTBEAT
+) -> T.AsyncIterator[str]:
+    """
+    Server-sent events for the status changes of `scene_id`, or of every
+    scene. A single scene stream starts with the current status and ends
+    when the scene is edited or failed, right away if there is no such
+    scene.
+    """
+    with bus.subscribe(scene_id) as queue:
+        watcher.ensure_started()
+
+        if scene_id is not None:
+            async with db.SessionLocal() as session:
+                scene = await db.get_scene(session, scene_id)
+            if scene is None:
+                logger.warning("no scene to stream", scene_id=scene_id)
+                return
+
+            event = scene_event(scene)
+            yield _format(event)
+            if event["status"] in FINAL_STATUSES:
+                return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            yield _format(event)
+            if scene_id is not None and event["status"] in FINAL_STATUSES:
+                return
@@ -1,21 +1,77 @@
-import base64
-from io import BytesIO
+import asyncio
+import random
 import typing as T
 from uuid import uuid4
 
+import aiohttp
 from gcloud.aio.storage import Storage, Blob
+from gcloud.aio.storage.storage import init_api_root
 from loguru import logger
 
-from core.config import S3_BUCKET
+from core import digest, tracing
+from core.cache import TTLCache
+from core.config import (
+    S3_BUCKET,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_MAX_SIZE,
+    PRESIGNED_URL_CACHE_SIZE,
+    PRESIGNED_URL_CACHE_MARGIN,
+)
+from core.metrics import observe
+
+
+# resumable upload chunks must be a multiple of this size, except the last one
+GCS_CHUNK_ALIGNMENT = 256 * 1024
+# attempts at sending a chunk that the server doesn't store
+UPLOAD_RETRIES = 5
+UPLOAD_TIMEOUT = aiohttp.ClientTimeout(total=60)
+# statuses of a chunk upload worth retrying
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class UploadTooLarge(ValueError):
+    pass
 
 
 class S3Storage(object):
-    def __init__(self, bucket: str):
+    def __init__(
+        self,
+        bucket: str,
+        url_cache_size: int = 0,
+        url_cache_margin: float = 0.2,
+        api_root: T.Optional[str] = None,
+    ):
         """
         The object manages uploads to a bucket and also the creation
         of temporary download urls.
+        Signed urls are reused until `url_cache_margin` of their lifetime is left.
+        `api_root` points the client to another server, such as an emulator.
         """
         self.bucket = bucket
+        self.api_is_dev, self.api_root = init_api_root(api_root)
+        self._client: T.Optional[Storage] = None
+        self.url_cache_margin = url_cache_margin
+        self.url_cache = (
+            TTLCache("presigned_urls", url_cache_size, 0)
+            if url_cache_size > 0
+            else None
+        )
+
+    @property
+    def client(self) -> Storage:
+        """
+        A single client (and its http session and access token) is shared
+        by every call for the lifetime of the application.
+        """
+        if self._client is None:
+            self._client = Storage(api_root=self.api_root, api_is_dev=self.api_is_dev)
+
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
 
     @staticmethod
     def _get_id(obj_url: str) -> str:
@@ -28,37 +84,251 @@ class S3Storage(object):
 
         return obj_url
 
-    async def save(self, content: str) -> str:
+    @tracing.traced("storage.save")
+    @observe("storage", "save")
+    async def save(self, content: bytes, content_type: T.Optional[str] = None) -> str:
         """
-        The function expects a base64-encoded image to be saved to a remote
-        s3 bucket. The resource name is randomly generated.
+        The function expects the raw bytes of an image to be saved to a remote
+        s3 bucket. The buffer is uploaded as-is, without being copied.
+        The resource name is the SHA-256 of the content, so saving the same
+        bytes twice yields the same object, and it is only uploaded once.
         """
-        rand_id = str(uuid4())
-        decoded = base64.b64decode(content)
+        obj_id = await digest.sha256(content)
+        obj_url = f"gs://{self.bucket}/{obj_id}"
 
-        async with Storage() as client:
-            try:
-                logger.debug("uploading to s3", bucket=self.bucket, obj_id=rand_id)
-                await client.upload(self.bucket, rand_id, BytesIO(decoded))
-            except Exception:
+        try:
+            if await self._exists(obj_id):
+                logger.info("already in s3", bucket=self.bucket, obj_id=obj_id)
+                return obj_url
+
+            logger.debug("uploading to s3", bucket=self.bucket, obj_id=obj_id)
+            # the upload is refused if a concurrent one stored the object first
+            await self.client.upload(
+                self.bucket,
+                obj_id,
+                content,
+                content_type=content_type,
+                parameters={"ifGenerationMatch": "0"},
+            )
+        except aiohttp.ClientResponseError as e:
+            if e.status != 412:
                 logger.exception("failed to upload file")
                 raise
+            logger.info("already in s3", bucket=self.bucket, obj_id=obj_id)
+            return obj_url
+        except Exception:
+            logger.exception("failed to upload file")
+            raise
+
+        logger.info("uploaded to s3", bucket=self.bucket, obj_id=obj_id)
+        return obj_url
+
+    async def _exists(self, obj_id: str) -> bool:
+        try:
+            await self.client.download_metadata(self.bucket, obj_id)
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                return False
+            raise
+
+        return True
+
+    @tracing.traced("storage.save_stream")
+    @observe("storage", "save_stream")
+    async def save_stream(
+        self,
+        chunks: T.AsyncIterator[bytes],
+        content_type: str = "application/octet-stream",
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+        max_size: int = UPLOAD_MAX_SIZE,
+    ) -> str:
+        """
+        Save an image to the bucket as its bytes arrive, through a resumable
+        upload session. At most `chunk_size` bytes (rounded to the 256 KiB
+        granularity required by gcs) are buffered at any time, and a chunk
+        that fails is sent again from where the server says it stopped.
+        The content isn't known when the upload starts, so the resource name
+        is randomly generated.
+
+        :raise UploadTooLarge: past `max_size` bytes, the upload is cancelled
+        :raise ValueError: if there is no content at all
+        """
+        rand_id = str(uuid4())
+        chunk_size = max(
+            GCS_CHUNK_ALIGNMENT,
+            chunk_size // GCS_CHUNK_ALIGNMENT * GCS_CHUNK_ALIGNMENT,
+        )
+
+        logger.debug("streaming to s3", bucket=self.bucket, obj_id=rand_id)
+        session_uri = await self._start_upload(rand_id, content_type)
+        try:
+            offset = 0
+            buf = bytearray()
+            async for chunk in chunks:
+                buf += chunk
+                if offset + len(buf) > max_size:
+                    raise UploadTooLarge(f"Upload larger than {max_size} bytes")
 
-        logger.info("uploaded to s3", bucket=self.bucket, obj_id=rand_id)
+                # only full chunks can be sent before the end of the stream,
+                # and the last one must carry at least one byte
+                while len(buf) > chunk_size:
+                    stored = await self._send(session_uri, buf, offset, chunk_size)
+                    del buf[: stored - offset]
+                    offset = stored
+
+            total = offset + len(buf)
+            if total == 0:
+                raise ValueError("Empty upload")
+
+            while offset < total:
+                stored = await self._send(session_uri, buf, offset, len(buf), total)
+                del buf[: stored - offset]
+                offset = stored
+        except BaseException:
+            logger.exception("failed to upload file")
+            await self._cancel_upload(session_uri)
+            raise
+
+        logger.info("uploaded to s3", bucket=self.bucket, obj_id=rand_id, size=total)
         return f"gs://{self.bucket}/{rand_id}"
 
+    async def _headers(self) -> T.Dict[str, str]:
+        if self.api_is_dev:
+            return {}
+
+        return {"Authorization": f"Bearer {await self.client.token.get()}"}
+
+    async def _start_upload(self, obj_id: str, content_type: str) -> str:
+        """
+        Open a resumable upload session, whose uri the chunks are sent to.
+        The library only uploads content whose size is known beforehand.
+        """
+        async with self.client.session.session.post(
+            f"{self.api_root}/upload/storage/v1/b/{self.bucket}/o",
+            headers={
+                **(await self._headers()),
+                "Content-Length": "0",
+                "X-Upload-Content-Type": content_type,
+            },
+            params={"uploadType": "resumable", "name": obj_id},
+            timeout=UPLOAD_TIMEOUT,
+        ) as resp:
+            resp.raise_for_status()
+            return resp.headers["Location"]
+
+    async def _cancel_upload(self, session_uri: str):
+        try:
+            async with self.client.session.session.delete(
+                session_uri, timeout=UPLOAD_TIMEOUT
+            ):
+                pass
+        except Exception:
+            logger.warning("failed to cancel the upload session")
+
+    async def _send(
+        self,
+        session_uri: str,
+        buf: bytearray,
+        offset: int,
+        size: int,
+        total: T.Optional[int] = None,
+    ) -> int:
+        """
+        Send the first `size` bytes of `buf`, found at `offset` in the object.
+        When the server keeps none of them, the chunk is sent again after a
+        while, up to UPLOAD_RETRIES times.
+
+        :return: the offset the server stored the object up to, the bytes
+            of `buf` past it are to be sent again
+        """
+        for attempt in range(UPLOAD_RETRIES):
+            last = attempt + 1 == UPLOAD_RETRIES
+            try:
+                stored = await self._put(session_uri, bytes(buf[:size]), offset, total)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last or (
+                    isinstance(e, aiohttp.ClientResponseError)
+                    and e.status not in RETRYABLE_STATUSES
+                ):
+                    raise
+                logger.warning("chunk upload failed", offset=offset, error=str(e))
+                stored = await self._query_stored(session_uri, total, offset)
+
+            if stored < offset:
+                raise RuntimeError(f"Upload restarted at {stored} bytes")
+            if stored > offset:
+                return stored
+            if not last:
+                await asyncio.sleep(random.uniform(0, 2**attempt))
+
+        raise RuntimeError(f"Upload stuck at {offset} bytes")
+
+    async def _put(
+        self,
+        session_uri: str,
+        data: bytes,
+        offset: int,
+        total: T.Optional[int] = None,
+    ) -> int:
+        """
+        :return: the offset the server stored the object up to
+        """
+        headers = {"Content-Length": str(len(data))}
+        if data:
+            end = offset + len(data) - 1
+            headers["Content-Range"] = f"bytes {offset}-{end}/{total or '*'}"
+        else:
+            headers["Content-Range"] = f"bytes */{total or '*'}"
+
+        async with self.client.session.session.put(
+            session_uri,
+            headers=headers,
+            data=data,
+            timeout=UPLOAD_TIMEOUT,
+            allow_redirects=False,
+        ) as resp:
+            if resp.status in (200, 201):
+                return offset + len(data)
+            if resp.status == 308:
+                # "Range: bytes=0-N" once the server stored N + 1 bytes
+                stored = resp.headers.get("Range")
+                return int(stored.rpartition("-")[2]) + 1 if stored else 0
+            resp.raise_for_status()
+            raise RuntimeError(f"Unexpected upload status {resp.status}")
+
+    async def _query_stored(
+        self, session_uri: str, total: T.Optional[int], default: int
+    ) -> int:
+        """
+        How much of the object the server stored, `default` if it can't say.
+        """
+        try:
+            return await self._put(session_uri, b"", default, total)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return default
+
+    @tracing.traced("storage.get_presigned_url")
+    @observe("storage", "get_presigned_url")
     async def get_presigned_url(self, obj_url: str, expiration: int = 300) -> str:
         """
         Given the id of the file, generate a presigned URL to share it with some other service.
+        The blob is built locally instead of being fetched: signing only needs
+        its name, and with service-account credentials the signature is
+        computed locally too, so no network call is made.
         """
         obj_id = self._get_id(obj_url)
 
-        async with Storage() as client:
-            bucket = client.get_bucket(self.bucket)
-            blob = await bucket.get_blob(obj_id)
-            res = await self._get_presigned_url(blob, expiration)
+        bucket = self.client.get_bucket(self.bucket)
+        # Blob requires a size, which signing doesn't use
+        blob = Blob(bucket, obj_id, {"size": 0})
+        if self.url_cache is None:
+            return await self._get_presigned_url(blob, expiration)
 
-        return res
+        return await self.url_cache.get_or_load(
+            (obj_id, expiration),
+            lambda: self._get_presigned_url(blob, expiration),
+            ttl=expiration * (1 - self.url_cache_margin),
+        )
 
     async def _get_presigned_url(self, blob: Blob, expiration: int) -> str:
         try:
@@ -70,14 +340,13 @@ class S3Storage(object):
             logger.exception("failed to generate presigned url")
             raise
 
-        logger.info(
-            "presigned url generated", bucket=self.bucket, obj_id=blob.name, resp=resp
-        )
+        # the url itself is a credential, it stays out of the logs
+        logger.info("presigned url generated", bucket=self.bucket, obj_id=blob.name)
 
         return resp
 
 
-storage = S3Storage(S3_BUCKET)
+storage = S3Storage(S3_BUCKET, PRESIGNED_URL_CACHE_SIZE, PRESIGNED_URL_CACHE_MARGIN)
 
 
 if __name__ == "__main__":
@@ -93,14 +362,18 @@ if __name__ == "__main__":
     m = S3Storage(args.bucket)
 
     with open(args.fpath, "rb") as f:
-        image_bin = f.read()
-        content = base64.b64encode(image_bin)
+        content = f.read()
+
+    async def _run():
+        url = await m.save(content)
+        print(url)
+
+        obj_id = m._get_id(url)
+        print(obj_id)
 
-    url = asyncio.run(m.save(content))
-    print(url)
+        dl_url = await m.get_presigned_url(url)
+        print(dl_url)
 
-    obj_id = m._get_id(url)
-    print(obj_id)
+        await m.close()
 
-    dl_url = asyncio.run(m.get_presigned_url(url))
-    print(dl_url)
+    asyncio.run(_run())
@@ -1,9 +1,28 @@
 import base64
+import json
+import typing as T
 
 from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
 from loguru import logger
 
-from core.config import DESCRIBER_URL, DESCRIBER_API_KEY
+from core import tracing
+from core.balancer import Balancer
+from core.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS,
+    DESCRIBER_URL,
+    DESCRIBER_API_KEY,
+    HEDGE_BUDGET,
+    HEDGE_ENABLED,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    REPLICA_EJECT_AFTER,
+    REPLICA_EJECT_SECONDS,
+)
+from core.hedge import Hedger
+from core.metrics import observe
+from core.retry import CircuitBreaker
 
 
 SYSTEM_PROMPT = "You are a helpful assistant whose aim is to give the best possible description of any given image, with particular focus on identifying content and position of any text appearing in the image"
@@ -11,44 +30,87 @@ USER_PROMPT = (
     "Describe the provided image. What is written on the image and where is it located?"
 )
 
+FUSED_USER_PROMPT = """
+Describe the provided image: what is written on the image and where is it located?
+
+Then write a prompt for an image editing model that replaces any item with text
+on it with the object described by the text. For example, if a woman holds up a
+sign that says "red curly wig", the prompt instructs the model to put a red
+curly wig on the woman. Make it a model-friendly prompt, as works best for
+diffusion/image-editing models.
+
+Answer with a JSON object with two string fields, "description" and "prompt",
+and nothing else.
+"""
+
+
+class InvalidOutput(ValueError):
+    pass
+
 
 class Describer(object):
-    def __init__(self, addr: str, api_key: str):
-        self.ai = AsyncOpenAI(
-            base_url=addr,
-            api_key=api_key,
-        )
+    def __init__(
+        self,
+        addr: str,
+        api_key: str,
+        eject_after: int = 3,
+        eject_for: float = 30.0,
+        hedger: T.Optional[Hedger] = None,
+        breaker: T.Optional[CircuitBreaker] = None,
+    ):
+        self.replicas = Balancer("describer", addr, eject_after, eject_for)
+        self.hedger = hedger or Hedger("describer")
+        self.breaker = breaker or CircuitBreaker("describer")
+        self.ais = {
+            a: AsyncOpenAI(
+                base_url=a,
+                api_key=api_key,
+            )
+            for a in self.replicas.addrs
+        }
+
+    def _messages(self, content: str, prompt: str) -> T.List[dict]:
+        return [
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": SYSTEM_PROMPT,
+                    }
+                ],
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": content,
+                        },
+                    },
+                    {
+                        "type": "text",
+                        "text": prompt,
+                    },
+                ],
+            },
+        ]
+
+    @tracing.traced("describer.chat")
+    @observe("describer", "chat")
+    async def _create(self, **kwargs) -> ChatCompletion:
+        async with self.breaker.guard(), self.replicas.acquire() as addr:
+            return await self.ais[addr].chat.completions.create(**kwargs)
 
     async def run(self, content: str, ftype: str = "png") -> str:
-        res = await self.ai.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": SYSTEM_PROMPT,
-                        }
-                    ],
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": content,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": USER_PROMPT,
-                        },
-                    ],
-                },
-            ],
-            model="Qwen/Qwen3-VL-235B-A22B-Instruct",
-            max_tokens=100,
+        res = await self.hedger.run(
+            lambda: self._create(
+                messages=self._messages(content, USER_PROMPT),
+                model="Qwen/Qwen3-VL-235B-A22B-Instruct",
+                max_tokens=100,
+            ),
+            "describe",
         )
 
         if not res or len(res.choices) == 0 or not res.choices[0].message:
@@ -56,8 +118,54 @@ class Describer(object):
 
         return res.choices[0].message.content
 
+    async def describe_and_prompt(self, content: str) -> T.Tuple[str, str]:
+        """
+        Description and edit prompt of the image in a single call.
+
+        :raise InvalidOutput: if the answer is not the expected JSON object
+        """
+        res = await self.hedger.run(
+            lambda: self._create(
+                messages=self._messages(content, FUSED_USER_PROMPT),
+                model="Qwen/Qwen3-VL-235B-A22B-Instruct",
+                max_tokens=400,
+                response_format={"type": "json_object"},
+            ),
+            "describe_and_prompt",
+        )
 
-describer = Describer(DESCRIBER_URL, DESCRIBER_API_KEY)
+        if not res or len(res.choices) == 0 or not res.choices[0].message:
+            raise RuntimeError("Missing value")
+
+        try:
+            out = json.loads(res.choices[0].message.content or "")
+        except json.JSONDecodeError as e:
+            raise InvalidOutput("answer is not JSON") from e
+
+        description = out.get("description") if isinstance(out, dict) else None
+        prompt = out.get("prompt") if isinstance(out, dict) else None
+        if not isinstance(description, str) or not description.strip():
+            raise InvalidOutput("missing description")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise InvalidOutput("missing prompt")
+
+        return description, prompt.strip()
+
+
+describer = Describer(
+    DESCRIBER_URL,
+    DESCRIBER_API_KEY,
+    REPLICA_EJECT_AFTER,
+    REPLICA_EJECT_SECONDS,
+    Hedger(
+        "describer",
+        HEDGE_ENABLED,
+        HEDGE_PERCENTILE,
+        HEDGE_BUDGET,
+        min_samples=HEDGE_MIN_SAMPLES,
+    ),
+    CircuitBreaker("describer", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+)
 
 if __name__ == "__main__":
     import argparse
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+import time
+import typing as T
+
+from loguru import logger
+
+import db
+from core.cache import CANCELLED, SingleFlight, caches
+from core.config import (
+    DESCRIPTION_CACHE_DISTANCE,
+    DESCRIPTION_CACHE_ENABLED,
+    DESCRIPTION_CACHE_SIZE,
+)
+from services.describer import Describer, describer
+
+BANDS = 8
+# with 8 bands of 8 bits, any two hashes closer than 8 bits share a band
+MAX_DISTANCE = BANDS - 1
+
+
+def bands(h: int) -> T.List[int]:
+    return [(h >> (8 * (BANDS - 1 - i))) & 0xFF for i in range(BANDS)]
+
+
+class DescriptionCache(object):
+    def __init__(
+        self, describer: Describer, enabled: bool, maxsize: int, max_distance: int
+    ):
+        """
+        Sits in front of the describer and reuses the description of a
+        picture whose perceptual hash is within `max_distance` bits.
+        Recent descriptions are kept in an in-memory LRU, all of them are
+        stored in the database. Concurrent misses for pictures within
+        `max_distance` share a single lookup and describer call.
+        """
+        self.describer = describer
+        self.enabled = enabled
+        self.maxsize = maxsize
+        self.max_distance = min(max_distance, MAX_DISTANCE)
+        self.entries: OrderedDict[int, str] = OrderedDict()
+        self.loads = SingleFlight()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.describe_seconds = 0.0
+
+        if enabled:
+            caches["descriptions"] = self
+
+    def _nearest(self, keys: T.Iterable[int], h: int) -> T.Optional[int]:
+        best = None
+        for key in keys:
+            distance = (key ^ h).bit_count()
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, key)
+
+        return best[1] if best is not None else None
+
+    def _lookup_memory(self, h: int) -> T.Optional[str]:
+        key = self._nearest(self.entries, h)
+        if key is None:
+            return None
+
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    async def _lookup_db(self, h: int) -> T.Optional[str]:
+        async with db.SessionLocal() as session:
+            rows = await db.find_descriptions_by_bands(session, bands(h))
+
+        found = {int(row.phash, 16): row.description for row in rows}
+        key = self._nearest(found, h)
+        return found[key] if key is not None else None
+
+    def _remember(self, h: int, description: str):
+        self.entries[h] = description
+        self.entries.move_to_end(h)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    async def run(
+        self,
+        url: str,
+        phash: T.Optional[str],
+        describe: T.Optional[T.Callable[[str], T.Awaitable[str]]] = None,
+    ) -> str:
+        """
+        :param describe: called on a miss instead of the describer's run
+        """
+        describe = describe or self.describer.run
+        if not self.enabled or phash is None:
+            return await describe(url)
+
+        h = int(phash, 16)
+        while True:
+            description = self._lookup_memory(h)
+            if description is not None:
+                self.memory_hits += 1
+                return description
+
+            key = self._nearest(self.loads.pending, h)
+            if key is None:
+                break
+
+            self.coalesced += 1
+            description = await self.loads.wait(key)
+            if description is not CANCELLED:
+                return description
+
+        return await self.loads.run(h, lambda: self._load(url, phash, h, describe))
+
+    async def _load(
+        self,
+        url: str,
+        phash: str,
+        h: int,
+        describe: T.Callable[[str], T.Awaitable[str]],
+    ) -> str:
+        description = await self._lookup_db(h)
+        if description is not None:
+            self.db_hits += 1
+            self._remember(h, description)
+            return description
+
+        self.misses += 1
+        start = time.perf_counter()
+        description = await describe(url)
+        self.describe_seconds += time.perf_counter() - start
+
+        self._remember(h, description)
+        try:
+            async with db.SessionLocal() as session:
+                await db.create_description(session, phash, bands(h), description)
+        except Exception:
+            logger.exception("failed to store the description", phash=phash)
+
+        return description
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.db_hits + self.coalesced
+        lookups = hits + self.misses
+        avg_describe = self.describe_seconds / self.misses if self.misses else 0.0
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "max_distance": self.max_distance,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "avg_describe_seconds": avg_describe,
+            "estimated_saved_seconds": hits * avg_describe,
+        }
+
+
+descriptions = DescriptionCache(
+    describer,
+    DESCRIPTION_CACHE_ENABLED,
+    DESCRIPTION_CACHE_SIZE,
+    DESCRIPTION_CACHE_DISTANCE,
+)
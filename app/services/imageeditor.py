@@ -1,40 +1,117 @@
-import requests
-from core.config import IMAGE_EDITOR_URL, IMAGE_EDITOR_API_KEY
+import base64
+import typing as T
+
+import httpx
+from core import tracing
+from core.balancer import Balancer
+from core.metrics import observe
+from core.retry import CircuitBreaker
+from core.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS,
+    IMAGE_EDITOR_URL,
+    IMAGE_EDITOR_API_KEY,
+    IMAGE_EDITOR_CONNECT_TIMEOUT,
+    IMAGE_EDITOR_READ_TIMEOUT,
+    IMAGE_EDITOR_MAX_CONNECTIONS,
+    IMAGE_EDITOR_HTTP2,
+    REPLICA_EJECT_AFTER,
+    REPLICA_EJECT_SECONDS,
+)
 import fs
 from loguru import logger
 
 
 class ImageEditor(object):
-    def __init__(self, addr: str, api_key: str):
+    def __init__(
+        self,
+        addr: str,
+        api_key: str,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        max_connections: int = 10,
+        http2: bool = False,
+        eject_after: int = 3,
+        eject_for: float = 30.0,
+        breaker: T.Optional[CircuitBreaker] = None,
+    ):
         self.api_key = api_key
-        self.base_url = addr
+        self.replicas = Balancer("image_editor", addr, eject_after, eject_for)
+        self.breaker = breaker or CircuitBreaker("image_editor")
+        self.timeout = httpx.Timeout(
+            read_timeout, connect=connect_timeout, read=read_timeout
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.http2 = http2
+        self._clients: T.Dict[str, httpx.AsyncClient] = {}
+
+    def client(self, addr: str) -> httpx.AsyncClient:
+        """
+        The client of a replica is created lazily so that it binds to the
+        running event loop, and is then reused to keep the connections alive.
+        """
+        client = self._clients.get(addr)
+        if client is None or client.is_closed:
+            client = self._clients[addr] = httpx.AsyncClient(
+                base_url=addr,
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+            )
 
-    def _run(self, url: str, prompt: str):
+        return client
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    @tracing.traced("image_editor.predict")
+    @observe("image_editor", "predict")
+    async def _run(self, url: str, prompt: str):
         logger.debug("Requesting image editing")
-        resp = requests.post(
-            self.base_url + "/predict",
-            json={
-                "prompt": prompt,
-                "input_image_url": url,
-                "width": 1920,
-                "height": 1080,
-            },
-        )
+        async with self.breaker.guard(), self.replicas.acquire() as addr:
+            resp = await self.client(addr).post(
+                "/predict",
+                json={
+                    "prompt": prompt,
+                    "input_image_url": url,
+                    "width": 1920,
+                    "height": 1080,
+                },
+            )
 
-        if not resp or resp.status_code != 200:
-            resp.raise_for_status()
+            if not resp or resp.status_code != 200:
+                resp.raise_for_status()
 
         return resp.json()
 
-    async def run(self, url: str, prompt: str) -> str:
-        result = self._run(url, prompt)
+    async def run(self, url: str, prompt: str) -> bytes:
+        """
+        Returns the raw bytes of the edited image. This is the only place
+        where the base64 payload of the model is decoded.
+        """
+        result = await self._run(url, prompt)
         if not result or len(result["images"]) == 0 or not result["images"][0]:
             raise RuntimeError("No result returned")
 
-        return result["images"][0].rsplit(",")[1]
+        return base64.b64decode(result["images"][0].rsplit(",")[1])
 
 
-image_editor = ImageEditor(IMAGE_EDITOR_URL, IMAGE_EDITOR_API_KEY)
+image_editor = ImageEditor(
+    IMAGE_EDITOR_URL,
+    IMAGE_EDITOR_API_KEY,
+    IMAGE_EDITOR_CONNECT_TIMEOUT,
+    IMAGE_EDITOR_READ_TIMEOUT,
+    IMAGE_EDITOR_MAX_CONNECTIONS,
+    IMAGE_EDITOR_HTTP2,
+    REPLICA_EJECT_AFTER,
+    REPLICA_EJECT_SECONDS,
+    CircuitBreaker("image_editor", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+)
 
 if __name__ == "__main__":
     import argparse
@@ -50,6 +127,9 @@ if __name__ == "__main__":
 
     d = ImageEditor(args.url, args.api_key)
 
-    res = asyncio.run(d.run(args.image, args.prompt))
+    async def _run():
+        res = await d.run(args.image, args.prompt)
+        await d.close()
+        return await fs.storage.save(res)
 
-    fpath = asyncio.run(fs.storage.save(res))
+    fpath = asyncio.run(_run())
@@ -1,7 +1,30 @@
+import hashlib
+import typing as T
+import unicodedata
+
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion
 
-from core.config import PROMPTER_URL, PROMPTER_API_KEY
+from core import tracing
+from core.balancer import Balancer
+from core.cache import TTLCache
+from core.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS,
+    PROMPTER_URL,
+    PROMPTER_API_KEY,
+    PROMPT_CACHE_SIZE,
+    PROMPT_CACHE_TTL,
+    HEDGE_BUDGET,
+    HEDGE_ENABLED,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    REPLICA_EJECT_AFTER,
+    REPLICA_EJECT_SECONDS,
+)
+from core.hedge import Hedger
+from core.metrics import observe
+from core.retry import CircuitBreaker
 
 
 USER_PROMPT_TEMPLATE = """
@@ -27,30 +50,75 @@ Only include the prompt and nothing else.
 """
 
 
+def description_key(description: str) -> str:
+    """
+    Descriptions differing only in unicode form or whitespace give the same key.
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", description).split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
 class Prompter(object):
-    def __init__(self, addr: str, api_key: str):
-        self.ai = AsyncOpenAI(
-            base_url=addr,
-            api_key=api_key,
+    def __init__(
+        self,
+        addr: str,
+        api_key: str,
+        cache_size: int = 0,
+        cache_ttl: float = 0,
+        eject_after: int = 3,
+        eject_for: float = 30.0,
+        hedger: T.Optional[Hedger] = None,
+        breaker: T.Optional[CircuitBreaker] = None,
+    ):
+        """
+        When `cache_size` > 0, prompts are memoized per normalized description
+        for `cache_ttl` seconds and identical concurrent requests share one call.
+        """
+        self.replicas = Balancer("prompter", addr, eject_after, eject_for)
+        self.hedger = hedger or Hedger("prompter")
+        self.breaker = breaker or CircuitBreaker("prompter")
+        self.ais = {
+            a: AsyncOpenAI(
+                base_url=a,
+                api_key=api_key,
+            )
+            for a in self.replicas.addrs
+        }
+        self.cache = (
+            TTLCache("prompts", cache_size, cache_ttl) if cache_size > 0 else None
         )
 
     async def _run(self, description: str) -> ChatCompletion:
-        return await self.ai.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": USER_PROMPT_TEMPLATE % description,
-                        },
-                    ],
-                },
-            ],
-            model="Qwen/Qwen3-14B",
-        )
+        return await self.hedger.run(lambda: self._create(description))
+
+    @tracing.traced("prompter.chat")
+    @observe("prompter", "chat")
+    async def _create(self, description: str) -> ChatCompletion:
+        async with self.breaker.guard(), self.replicas.acquire() as addr:
+            return await self.ais[addr].chat.completions.create(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": USER_PROMPT_TEMPLATE % description,
+                            },
+                        ],
+                    },
+                ],
+                model="Qwen/Qwen3-14B",
+            )
 
     async def run(self, description: str) -> str:
+        if self.cache is None:
+            return await self._generate(description)
+
+        return await self.cache.get_or_load(
+            description_key(description), lambda: self._generate(description)
+        )
+
+    async def _generate(self, description: str) -> str:
         result = await self._run(description)
         if (
             not result
@@ -62,7 +130,22 @@ class Prompter(object):
         return result.choices[0].message.content.lstrip("\n\n")
 
 
-prompter = Prompter(PROMPTER_URL, PROMPTER_API_KEY)
+prompter = Prompter(
+    PROMPTER_URL,
+    PROMPTER_API_KEY,
+    PROMPT_CACHE_SIZE,
+    PROMPT_CACHE_TTL,
+    REPLICA_EJECT_AFTER,
+    REPLICA_EJECT_SECONDS,
+    Hedger(
+        "prompter",
+        HEDGE_ENABLED,
+        HEDGE_PERCENTILE,
+        HEDGE_BUDGET,
+        min_samples=HEDGE_MIN_SAMPLES,
+    ),
+    CircuitBreaker("prompter", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+)
 
 if __name__ == "__main__":
     import argparse
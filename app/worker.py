@@ -0,0 +1,206 @@
+import asyncio
+import os
+import signal
+import socket
+import typing as T
+
+from loguru import logger
+from prometheus_client import start_http_server
+
+import db
+from core import executor, tracing
+from core.retry import CircuitOpen
+from core.config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF,
+    JOB_VISIBILITY_TIMEOUT,
+    METRICS_PORT,
+    RESUME_ON_STARTUP,
+    WORKER_CONCURRENCY,
+    WORKER_POLL_INTERVAL,
+)
+from models.db import JOB_RUNNING
+from pipeline import DuplicateInFlight, pipeline
+from s3 import storage
+from services.imageeditor import image_editor
+
+
+class Worker(object):
+    def __init__(
+        self,
+        concurrency: int,
+        poll_interval: float,
+        visibility_timeout: int,
+        max_attempts: int,
+        resume: bool = False,
+        retry_backoff: float = 0,
+    ):
+        """
+        The worker claims scene jobs from the database queue and runs the
+        pipeline for each of them, up to `concurrency` jobs at a time. While
+        a job runs its heartbeat is refreshed a few times per
+        `visibility_timeout`, so that no other worker takes it over.
+        """
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.resume = resume
+        self.retry_backoff = retry_backoff
+        self.stopping = asyncio.Event()
+        self.tasks: set[asyncio.Task] = set()
+
+    async def sweep(self):
+        """
+        Queue a new job for every interrupted scene, the pipeline then picks
+        up each of them from its last completed stage. Workers starting
+        together may all sweep: each scene is still queued once.
+        """
+        try:
+            async with db.SessionLocal() as session:
+                scene_ids = await db.enqueue_interrupted_scenes(session)
+        except Exception:
+            logger.exception("failed to resume interrupted scenes")
+            return
+
+        if scene_ids:
+            logger.info("resuming interrupted scenes", scene_ids=scene_ids)
+
+    async def _claim(self):
+        try:
+            async with db.SessionLocal() as session:
+                job = await db.claim_job(
+                    session, self.name, self.visibility_timeout, self.max_attempts
+                )
+        except Exception:
+            logger.exception("failed to claim a job", worker=self.name)
+            return None
+
+        return job
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                async with db.SessionLocal() as session:
+                    if not await db.heartbeat_job(session, job_id, self.name):
+                        logger.warning("job taken over", job_id=job_id)
+                        return
+            except Exception:
+                logger.exception("failed to refresh the job heartbeat", job_id=job_id)
+
+    async def _finish(self, job_id: int, finish: T.Callable, *args):
+        """
+        Call `finish` with the job, unless another worker took it over.
+        """
+        async with db.SessionLocal() as session:
+            job = await db.get_job(session, job_id)
+            if job.worker != self.name or job.status != JOB_RUNNING:
+                logger.warning("job taken over", job_id=job_id)
+                return
+            await finish(session, job, *args)
+
+    async def _process(self, job_id: int, slots: asyncio.Semaphore):
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            async with db.SessionLocal() as session:
+                job = await db.get_job(session, job_id)
+                scene = await db.get_scene(session, job.scene_id)
+            logger.info("job claimed", job_id=job.id, scene_id=scene.id)
+
+            try:
+                with tracing.continue_trace(
+                    "job",
+                    job.trace_context,
+                    scene.id,
+                    {"job.id": job.id, "job.attempt": job.attempts},
+                ):
+                    await pipeline(scene, final=job.attempts >= self.max_attempts)
+            except DuplicateInFlight as e:
+                await self._finish(job_id, db.release_job, e.retry_after)
+                return
+            except CircuitOpen as e:
+                # not the job's fault: give the attempt back, and hold this
+                # slot until the endpoint may be called again
+                await self._finish(job_id, db.release_job, e.retry_after)
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), e.retry_after)
+                except asyncio.TimeoutError:
+                    pass
+                return
+            except Exception as e:
+                await self._finish(
+                    job_id, db.fail_job, str(e), self.max_attempts, self.retry_backoff
+                )
+                return
+
+            await self._finish(job_id, db.complete_job)
+            logger.info("job done", job_id=job_id)
+        except Exception:
+            logger.exception("failed to process the job", job_id=job_id)
+        finally:
+            heartbeat.cancel()
+            slots.release()
+
+    async def run(self):
+        logger.info("worker started", worker=self.name)
+        if self.resume:
+            await self.sweep()
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        while not self.stopping.is_set():
+            await slots.acquire()
+            job = await self._claim()
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._process(job.id, slots))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        logger.info("worker stopped", worker=self.name)
+
+    def stop(self):
+        self.stopping.set()
+
+
+def get_worker() -> Worker:
+    return Worker(
+        WORKER_CONCURRENCY,
+        WORKER_POLL_INTERVAL,
+        JOB_VISIBILITY_TIMEOUT,
+        JOB_MAX_ATTEMPTS,
+        RESUME_ON_STARTUP,
+        JOB_RETRY_BACKOFF,
+    )
+
+
+if __name__ == "__main__":
+
+    async def _run():
+        tracing.setup("aie-worker")
+        if METRICS_PORT:
+            import collectors  # noqa: F401
+
+            start_http_server(METRICS_PORT)
+
+        worker = get_worker()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+        await image_editor.close()
+        await storage.close()
+        await executor.shutdown()
+        tracing.shutdown()
+
+    asyncio.run(_run())
@@ -0,0 +1,51 @@
+from datetime import datetime
+import os
+import tempfile
+
+# the app reads its settings from the environment when first imported
+_db = tempfile.NamedTemporaryFile(prefix="aie-test-", suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db.name}"
+os.environ.setdefault("DESCRIBER_API_KEY", "test")
+os.environ.setdefault("PROMPTER_API_KEY", "test")
+os.environ.setdefault("S3_BUCKET", "test")
+os.environ["LOG_QUEUE_SIZE"] = "0"
+
+import pytest
+
+import db
+from models.db import SCENE_PENDING, Base, Scene
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session():
+    async with db.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with db.SessionLocal() as session:
+        yield session
+
+    async with db.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await db.engine.dispose()
+
+
+@pytest.fixture
+def make_scene():
+    def make(**fields) -> Scene:
+        now = datetime.now()
+        defaults = {
+            "email": "user@example.com",
+            "name": "name",
+            "created_at": now,
+            "modified_at": now,
+            "original_data": "gs://bucket/object",
+            "status": SCENE_PENDING,
+        }
+        return Scene(**{**defaults, **fields})
+
+    return make
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import db
+from admission import Admission
+from core.cache import caches
+from models.db import JOB_DONE, JOB_FAILED, JOB_RUNNING
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def make_admission():
+    def make(**settings) -> Admission:
+        return Admission(**{"window": 100, "retry_after": 30, **settings})
+
+    yield make
+    caches.pop("backlog", None)
+
+
+def backlog(pending: int, throughput: float) -> dict:
+    return {
+        "backlog": pending,
+        "throughput": throughput,
+        "estimated_wait": pending / throughput if throughput else None,
+    }
+
+
+@pytest.mark.parametrize(
+    "settings, state, retry_after",
+    [
+        ({"max_backlog": 10}, backlog(9, 1.0), None),
+        # one scene over the limit, done in a second
+        ({"max_backlog": 10}, backlog(10, 1.0), 1),
+        ({"max_backlog": 10}, backlog(29, 0.5), 40),
+        # nothing done lately: the configured retry_after
+        ({"max_backlog": 10}, backlog(10, 0.0), 30),
+        ({"max_wait": 60}, backlog(50, 1.0), None),
+        ({"max_wait": 60}, backlog(90, 1.0), 30),
+        ({"max_backlog": 10}, backlog(10_000, 0.01), 600),
+    ],
+)
+def test_retry_after(make_admission, settings, state, retry_after):
+    assert make_admission(**settings)._retry_after(state) == retry_after
+
+
+async def test_backlog_counts_active_jobs(session, make_scene, make_admission):
+    now = datetime.now()
+    for status, finished_at in [
+        (JOB_RUNNING, None),
+        (JOB_DONE, now - timedelta(seconds=10)),
+        (JOB_DONE, now - timedelta(seconds=10)),
+        # outside the window
+        (JOB_DONE, now - timedelta(seconds=1000)),
+        (JOB_FAILED, now),
+    ]:
+        job = await db.create_scene_job(session, make_scene())
+        job.status = status
+        job.finished_at = finished_at
+        await session.commit()
+    await db.create_scene_job(session, make_scene())
+
+    res = await make_admission(max_backlog=2).backlog()
+
+    assert res["pending"] == 1
+    assert res["running"] == 1
+    assert res["throughput"] == 2 / 100
+    assert res["estimated_wait"] == 100
+    assert not res["accepting"]
+
+
+async def test_admit_refuses_with_retry_after(session, make_scene, make_admission):
+    await db.create_scene_job(session, make_scene())
+
+    with pytest.raises(HTTPException) as e:
+        await make_admission(max_backlog=1).admit()
+
+    assert e.value.status_code == 429
+    assert e.value.headers == {"Retry-After": "30"}
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from core.cache import TTLCache
+
+pytestmark = pytest.mark.anyio
+
+
+def test_lru_eviction():
+    cache = TTLCache("test_lru", 2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire():
+    cache = TTLCache("test_ttl", 2, 60)
+    cache.set("a", 1, ttl=0)
+
+    assert cache.get("a") is None
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = TTLCache("test_coalesce", 2, 60)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    values = await asyncio.gather(*[cache.get_or_load("a", load) for _ in range(5)])
+
+    assert values == [1] * 5
+    assert await cache.get_or_load("a", load) == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["hits"] == 1
+
+
+async def test_errors_reach_every_waiter_and_are_not_cached():
+    cache = TTLCache("test_errors", 2, 60)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(
+        *[cache.get_or_load("a", fail) for _ in range(3)], return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.get("a") is None
+    assert not cache.loads.pending
+
+
+async def test_cancelled_loader_does_not_cancel_waiters():
+    cache = TTLCache("test_cancel", 2, 60)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "value"
+
+    first = asyncio.create_task(cache.get_or_load("a", slow))
+    await started.wait()
+    second = asyncio.create_task(cache.get_or_load("a", fast))
+    await asyncio.sleep(0)
+
+    first.cancel()
+
+    assert await second == "value"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert not cache.loads.pending
+
+
+async def test_cancelled_waiter_leaves_the_load_running():
+    cache = TTLCache("test_cancel_waiter", 2, 60)
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        return "value"
+
+    first = asyncio.create_task(cache.get_or_load("a", load))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(cache.get_or_load("a", load))
+    await asyncio.sleep(0)
+
+    second.cancel()
+    release.set()
+
+    assert await first == "value"
+    with pytest.raises(asyncio.CancelledError):
+        await second
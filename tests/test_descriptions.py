@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from api.routes import scene as scene_routes
+from core.cache import caches
+from services.descriptions import DescriptionCache
+
+pytestmark = pytest.mark.anyio
+
+
+class SlowDescriber(object):
+    def __init__(self):
+        self.calls = 0
+
+    async def run(self, url: str) -> str:
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(0.05)
+        return f"description {call}"
+
+
+@pytest.fixture
+def cache(session):
+    describer = SlowDescriber()
+    yield DescriptionCache(describer, True, 16, 4)
+    caches.pop("descriptions", None)
+
+
+async def test_near_misses_share_one_description(cache):
+    # the second hash is 1 bit away from the first, the third is far away
+    results = await asyncio.gather(
+        cache.run("a", "00000000000000f0"),
+        cache.run("b", "00000000000000f1"),
+        cache.run("c", "ffffffffffffffff"),
+    )
+
+    assert results[0] == results[1]
+    assert results[2] != results[0]
+    assert cache.describer.calls == 2
+    assert cache.stats()["coalesced"] == 1
+
+
+async def test_stored_descriptions_are_reused(cache):
+    first = await cache.run("a", "00000000000000f0")
+    cache.entries.clear()
+
+    assert await cache.run("b", "00000000000000f0") == first
+    assert cache.describer.calls == 1
+    assert cache.stats()["db_hits"] == 1
+
+
+async def test_failed_description_is_shared(cache):
+    async def fail(url):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    cache.describer.run = fail
+    results = await asyncio.gather(
+        cache.run("a", "00000000000000f0"),
+        cache.run("b", "00000000000000f0"),
+        return_exceptions=True,
+    )
+
+    assert [str(r) for r in results] == ["boom", "boom"]
+    assert cache.loads.pending == {}
+
+
+async def test_phash_is_skipped_without_the_cache(monkeypatch):
+    monkeypatch.setattr(scene_routes, "DESCRIPTION_CACHE_ENABLED", False)
+
+    assert await scene_routes._phash(b"not a picture") is None
+
+
+async def test_phash_ignores_non_pictures_without_ingest(monkeypatch):
+    monkeypatch.setattr(scene_routes, "DESCRIPTION_CACHE_ENABLED", True)
+    monkeypatch.setattr(scene_routes, "INGEST_ENABLED", False)
+
+    assert await scene_routes._phash(b"not a picture") is None
+
+
+async def test_cancelled_description_is_loaded_again(cache):
+    first = asyncio.create_task(cache.run("a", "00000000000000f0"))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(cache.run("b", "00000000000000f1"))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "description 2"
+    assert cache.describer.calls == 2
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from core import executor
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_process_pool_does_not_fork(monkeypatch):
+    monkeypatch.setattr(executor, "IMAGE_EXECUTOR", "process")
+    monkeypatch.setattr(executor, "_executor", None)
+
+    try:
+        pool = executor.get_executor()
+        assert pool._mp_context.get_start_method() == "forkserver"
+        assert await executor.run(os.getpid) != os.getpid()
+    finally:
+        await executor.shutdown()
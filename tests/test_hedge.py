@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from core.hedge import Hedger, hedgers
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def hedger():
+    hedger = Hedger("test", True, 0.5, 1.0, min_samples=1)
+    yield hedger
+    hedgers.pop("test", None)
+
+
+async def test_hedge_wins_and_the_loser_is_awaited(hedger):
+    hedger.latencies["default"] = [0.01]
+    started = []
+    cancelled = []
+
+    async def call():
+        started.append(None)
+        if len(started) == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(None)
+                raise
+        return len(started)
+
+    assert await hedger.run(call) == 2
+    assert cancelled
+    assert hedger.hedge_wins == 1
+    # the winner and the loser, timed up to its cancellation, are recorded
+    first, winner, loser = hedger.latencies["default"]
+    assert loser >= 0.01
+
+
+async def test_latencies_are_kept_per_kind(hedger):
+    async def call():
+        return None
+
+    await hedger.run(call, "fast")
+
+    assert hedger.delay("fast") is not None
+    assert hedger.delay("slow") is None
+    assert list(hedger.stats()["delays"]) == ["fast"]
+
+
+async def test_all_attempts_failing_raises(hedger):
+    async def call():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await hedger.run(call)
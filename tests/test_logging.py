@@ -0,0 +1,106 @@
+import base64
+import io
+import logging
+import threading
+
+import pytest
+
+from core.logging import QueueSink, Sampler, summarize
+
+PAYLOAD = base64.b64encode(bytes(range(256)) * 4).decode()
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        b"\x00" * 300,
+        bytearray(300),
+        PAYLOAD,
+        f"data:image/png;base64,{PAYLOAD}",
+    ],
+)
+def test_binary_values_are_hashed(value):
+    summary = summarize(value, 256)
+
+    assert summary.startswith(f"<{len(value)} ")
+    assert "sha256:" in summary
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "https://storage.googleapis.com/bucket/object?X-Goog-Signature=" + "a1" * 200,
+        "Traceback: " + "connection refused; " * 30,
+        "/uploads/scene.png," * 30,
+    ],
+)
+def test_text_is_truncated(value):
+    summary = summarize(value, 256)
+
+    assert summary.startswith(value[:256])
+    assert summary.endswith(f"...(+{len(value) - 256} chars)")
+
+
+def test_small_values_are_kept():
+    assert summarize("short", 256) == "short"
+    assert summarize(42, 256) == 42
+    assert summarize([1, 2], 256) == [1, 2]
+
+
+def test_large_collections_are_described():
+    assert summarize(list(range(100)), 256) == "<list of 100 items>"
+    assert summarize({"a": "b" * 300}, 256).endswith("...(+53 chars)")
+
+
+def test_sampler_parse():
+    assert Sampler.parse("job claimed=0.1, image edited = 0.5,,") == {
+        "job claimed": 0.1,
+        "image edited": 0.5,
+    }
+    assert Sampler.parse("") == {}
+
+
+class Level(object):
+    def __init__(self, no: int):
+        self.no = no
+
+
+def record(message: str, level: int) -> dict:
+    return {"message": message, "level": Level(level)}
+
+
+def test_sampler_keeps_warnings():
+    sampler = Sampler({"noisy": 0.0})
+
+    assert not sampler(record("noisy", logging.INFO))
+    assert sampler(record("noisy", logging.WARNING))
+    assert sampler(record("other", logging.INFO))
+    assert sampler.sampled_out == 1
+
+
+class BlockingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, message: str) -> int:
+        self.writing.set()
+        self.release.wait(5)
+        return super().write(message)
+
+
+def test_queue_sink_drops_when_full():
+    stream = BlockingStream()
+    sink = QueueSink(stream, 1)
+
+    sink.write("first\n")
+    # the writer thread holds the first record, the second one fills the queue
+    assert stream.writing.wait(5)
+    sink.write("second\n")
+    sink.write("dropped\n")
+    stream.release.set()
+    sink.stop()
+
+    assert sink.dropped == 1
+    assert stream.getvalue() == "first\nsecond\n"
@@ -0,0 +1,115 @@
+import pytest
+
+import db
+import pipeline
+from core.cache import caches
+from models.db import SCENE_EDITED, SCENE_FAILED, SCENE_PENDING
+from pipeline import DuplicateInFlight, step_reuse
+from services.descriptions import DescriptionCache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_reuse_waits_for_an_older_duplicate(session, make_scene):
+    first = make_scene(content_hash="abc")
+    await db.create_scene_job(session, first)
+    second = make_scene(content_hash="abc")
+    await db.create_scene_job(session, second)
+
+    with pytest.raises(DuplicateInFlight) as e:
+        await step_reuse(session, second)
+    assert e.value.duplicate_id == first.id
+
+    # the older scene doesn't wait for the newer one
+    scene = await step_reuse(session, first)
+    assert scene.result is None
+
+
+async def test_reuse_copies_a_finished_duplicate(session, make_scene):
+    first = make_scene(
+        content_hash="abc", description="d", edit_prompt="p", result="gs://b/r"
+    )
+    job = await db.create_scene_job(session, first)
+    await db.complete_job(session, job)
+    second = make_scene(content_hash="abc")
+    await db.create_scene_job(session, second)
+
+    scene = await step_reuse(session, second)
+
+    assert scene.result == "gs://b/r"
+    assert scene.status == SCENE_EDITED
+
+
+async def test_reuse_ignores_other_uploads(session, make_scene):
+    await db.create_scene_job(session, make_scene(content_hash="abc"))
+    other = make_scene(content_hash="def")
+    await db.create_scene_job(session, other)
+
+    scene = await step_reuse(session, other)
+
+    assert scene.description is None
+
+
+class FusedDescriber(object):
+    def __init__(self):
+        self.calls = 0
+
+    async def describe_and_prompt(self, url: str):
+        self.calls += 1
+        return "a beach", "add a sunset"
+
+
+@pytest.fixture
+def fused_descriptions(session, monkeypatch):
+    cache = DescriptionCache(FusedDescriber(), True, 16, 4)
+    monkeypatch.setattr(pipeline, "descriptions", cache)
+    yield cache
+    caches.pop("descriptions", None)
+
+
+async def test_fused_step_stores_its_description(
+    session, make_scene, fused_descriptions
+):
+    scene = make_scene(phash="00000000000000f0")
+    await db.create_scene_job(session, scene)
+
+    scene = await pipeline.step_describe_prompt(session, scene, "url")
+    await session.refresh(scene)
+
+    assert scene.description == "a beach"
+    assert scene.edit_prompt == "add a sunset"
+    assert fused_descriptions.stats()["misses"] == 1
+
+
+async def test_fused_step_reuses_a_cached_description(
+    session, make_scene, fused_descriptions
+):
+    await db.create_scene_job(session, make_scene(phash="00000000000000f0"))
+    scene = make_scene(phash="00000000000000f1")
+    await db.create_scene_job(session, scene)
+    fused_descriptions._remember(0xF0, "a cached beach")
+
+    scene = await pipeline.step_describe_prompt(session, scene, "url")
+    await session.refresh(scene)
+
+    assert scene.description == "a cached beach"
+    assert scene.edit_prompt is None
+    assert fused_descriptions.describer.calls == 0
+
+
+@pytest.mark.parametrize("final", [False, True])
+async def test_failed_attempt(session, make_scene, monkeypatch, final):
+    async def step_reuse(session, scene):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(pipeline, "step_reuse", step_reuse)
+    scene = make_scene()
+    await db.create_scene_job(session, scene)
+
+    with pytest.raises(RuntimeError):
+        await pipeline.pipeline(scene, final=final)
+
+    await session.refresh(scene)
+    assert scene.error == "boom"
+    # only the last attempt marks the scene as failed
+    assert scene.status == (SCENE_FAILED if final else SCENE_PENDING)
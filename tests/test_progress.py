@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+from core.events import EventBus
+import progress
+from models.db import SCENE_EDITED
+
+pytestmark = pytest.mark.anyio
+
+
+async def collect(scene_id: int) -> list:
+    return [event async for event in progress.stream(scene_id, heartbeat=0.1)]
+
+
+async def test_stream_of_a_missing_scene_ends(session):
+    assert await collect(1) == []
+
+
+async def test_stream_of_a_finished_scene_ends(session, make_scene):
+    scene = make_scene(status=SCENE_EDITED)
+    await db.create_scene_job(session, scene)
+
+    events = await collect(scene.id)
+
+    assert len(events) == 1
+    assert events[0].startswith("event: edited\n")
+
+
+async def test_watcher_publishes_changes_committed_late(session, make_scene):
+    bus = EventBus()
+    watcher = progress.SceneWatcher(bus, interval=0.01, lookback=60)
+    now = datetime.now()
+    late, early = make_scene(modified_at=now - timedelta(seconds=5)), make_scene()
+    session.add(early)
+    await session.commit()
+    await session.refresh(early)
+
+    with bus.subscribe() as queue:
+        watcher.ensure_started()
+        assert (await asyncio.wait_for(queue.get(), 1))["scene_id"] == early.id
+
+        # modified before the change already published, committed after it
+        session.add(late)
+        await session.commit()
+        await session.refresh(late)
+        event = await asyncio.wait_for(queue.get(), 1)
+        assert event["scene_id"] == late.id
+        assert queue.empty()
+
+    await watcher.task
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+from models.db import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_PENDING,
+    JOB_RUNNING,
+    SCENE_FAILED,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_claim_oldest_pending_job(session, make_scene):
+    first = await db.create_scene_job(session, make_scene())
+    await db.create_scene_job(session, make_scene())
+
+    job = await db.claim_job(session, "w1", 600, 3)
+
+    assert job.id == first.id
+    assert job.status == JOB_RUNNING
+    assert job.attempts == 1
+    assert job.worker == "w1"
+    assert job.heartbeat_at is not None
+
+
+async def test_claim_empty_queue(session):
+    assert await db.claim_job(session, "w1", 600, 3) is None
+
+
+async def test_running_job_is_not_claimed_twice(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+
+    assert await db.claim_job(session, "w1", 600, 3) is not None
+    assert await db.claim_job(session, "w2", 600, 3) is None
+
+
+async def test_complete_job(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 3)
+
+    await db.complete_job(session, job)
+    await session.refresh(job)
+
+    assert job.status == JOB_DONE
+    assert job.finished_at is not None
+    assert await db.claim_job(session, "w1", 600, 3) is None
+
+
+async def test_release_job_gives_the_attempt_back(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 3)
+
+    await db.release_job(session, job)
+    await session.refresh(job)
+
+    assert job.status == JOB_PENDING
+    assert job.attempts == 0
+    assert (await db.claim_job(session, "w2", 600, 3)).worker == "w2"
+
+
+async def test_released_job_waits_for_its_delay(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 3)
+
+    await db.release_job(session, job, 60)
+
+    assert await db.claim_job(session, "w2", 600, 3) is None
+
+
+async def test_failed_attempt_backs_off(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 3)
+
+    await db.fail_job(session, job, "boom", 3, backoff=10)
+    await session.refresh(job)
+
+    assert job.status == JOB_PENDING
+    assert job.error == "boom"
+    assert job.not_before >= datetime.now() + timedelta(seconds=4)
+    assert await db.claim_job(session, "w1", 600, 3) is None
+
+    job.not_before = datetime.now() - timedelta(seconds=1)
+    await session.commit()
+    assert (await db.claim_job(session, "w1", 600, 3)).attempts == 2
+
+
+async def test_last_failed_attempt_fails_the_job(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 1)
+
+    await db.fail_job(session, job, "boom", 1, backoff=10)
+    await session.refresh(job)
+
+    assert job.status == JOB_FAILED
+    assert job.finished_at is not None
+    assert await db.claim_job(session, "w1", 600, 1) is None
+
+
+async def test_expired_job_is_reclaimed(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 3)
+    job.heartbeat_at = datetime.now() - timedelta(seconds=601)
+    await session.commit()
+
+    job = await db.claim_job(session, "w2", 600, 3)
+
+    assert job.worker == "w2"
+    assert job.attempts == 2
+
+
+async def test_heartbeat_keeps_the_job(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 3)
+    job_id = job.id
+    job.heartbeat_at = datetime.now() - timedelta(seconds=601)
+    await session.commit()
+
+    assert await db.heartbeat_job(session, job_id, "w1")
+    assert await db.claim_job(session, "w2", 600, 3) is None
+    assert not await db.heartbeat_job(session, job_id, "w2")
+
+
+async def test_expired_last_attempt_fails_job_and_scene(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+    job = await db.claim_job(session, "w1", 600, 1)
+    job.heartbeat_at = datetime.now() - timedelta(seconds=601)
+    await session.commit()
+
+    assert await db.claim_job(session, "w2", 600, 1) is None
+
+    await session.refresh(job)
+    scene = await db.get_scene(session, job.scene_id)
+    await session.refresh(scene)
+    assert job.status == JOB_FAILED
+    assert scene.status == SCENE_FAILED
+    assert scene.error == job.error
@@ -0,0 +1,112 @@
+import httpx
+import pytest
+
+from core.retry import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+    TooManyAttempts,
+    breakers,
+    with_retry,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://endpoint")
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class Flaky(object):
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def retried(call: Flaky):
+    @with_retry(3, 0)
+    async def flaky():
+        return await call()
+
+    return flaky
+
+
+@pytest.fixture
+def breaker():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    yield breaker
+    breakers.pop("test", None)
+
+
+async def test_retry_until_success():
+    call = Flaky(status_error(503), httpx.ConnectError("down"))
+
+    assert await retried(call)() == "ok"
+    assert call.calls == 3
+
+
+async def test_retry_gives_up():
+    call = Flaky(*[status_error(503)] * 3)
+
+    with pytest.raises(TooManyAttempts) as e:
+        await retried(call)()
+    assert isinstance(e.value.__cause__, httpx.HTTPStatusError)
+
+
+@pytest.mark.parametrize("error", [status_error(400), CircuitOpen("test", 1)])
+async def test_no_retry_for_errors_that_would_repeat(error):
+    call = Flaky(error)
+
+    with pytest.raises(type(error)):
+        await retried(call)()
+    assert call.calls == 1
+
+
+async def guarded(breaker: CircuitBreaker, call: Flaky):
+    async with breaker.guard():
+        return await call()
+
+
+async def test_breaker_opens_after_consecutive_failures(breaker):
+    call = Flaky(httpx.ConnectError("down"), status_error(502))
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPError):
+            await guarded(breaker, call)
+
+    assert breaker.state == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpen) as e:
+        await guarded(breaker, call)
+    assert 0 < e.value.retry_after <= 0.05
+    assert call.calls == 2
+
+
+async def test_breaker_ignores_rejected_requests(breaker):
+    call = Flaky(status_error(400), status_error(400), status_error(400))
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await guarded(breaker, call)
+
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+async def test_breaker_trial_call(breaker):
+    breaker._open()
+    breaker.opened_at -= 1
+
+    # a failed trial opens the circuit again, a successful one closes it
+    with pytest.raises(httpx.ConnectError):
+        await guarded(breaker, Flaky(httpx.ConnectError("down")))
+    assert breaker.state == CIRCUIT_OPEN
+
+    breaker.opened_at -= 1
+    assert await guarded(breaker, Flaky()) == "ok"
+    assert breaker.state == CIRCUIT_CLOSED
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+from models.db import (
+    SCENE_DESCRIBED,
+    SCENE_EDITED,
+    SCENE_FAILED,
+    SCENE_PENDING,
+    SCENE_PROMPTED,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_mark_scene_stamps_the_stage(make_scene):
+    scene = make_scene()
+    before = scene.modified_at
+
+    db.mark_scene(scene, SCENE_DESCRIBED)
+
+    assert scene.status == SCENE_DESCRIBED
+    assert scene.described_at is not None
+    assert scene.modified_at >= before
+    assert scene.prompted_at is None
+
+
+def test_every_stage_keeps_its_timestamp(make_scene):
+    scene = make_scene()
+
+    for status in (SCENE_DESCRIBED, SCENE_PROMPTED, SCENE_EDITED):
+        db.mark_scene(scene, status)
+
+    assert scene.status == SCENE_EDITED
+    assert scene.described_at <= scene.prompted_at <= scene.edited_at
+    assert scene.failed_at is None
+
+
+def test_mark_scene_records_and_clears_the_error(make_scene):
+    scene = make_scene()
+
+    db.mark_scene(scene, SCENE_FAILED, "boom")
+    assert scene.error == "boom"
+    assert scene.failed_at is not None
+
+    db.mark_scene(scene, SCENE_PENDING)
+    assert scene.error is None
+
+
+async def create_scenes(session, make_scene, n: int) -> list:
+    start = datetime(2026, 1, 1)
+    ids = []
+    for i in range(n):
+        ts = start + timedelta(minutes=i)
+        scene = make_scene(created_at=ts, modified_at=ts)
+        await db.create_scene(session, scene)
+        ids.append(scene.id)
+    return ids
+
+
+async def list_all(session, limit: int, **kwargs) -> list:
+    ids, after = [], None
+    while True:
+        page = await db.list_scenes(session, limit, after, **kwargs)
+        ids += [scene.id for scene in page]
+        if len(page) < limit:
+            return ids
+        after = db.decode_cursor(db.encode_cursor(page[-1]))
+
+
+async def test_list_scenes_newest_first(session, make_scene):
+    ids = await create_scenes(session, make_scene, 5)
+
+    assert await list_all(session, 2) == ids[::-1]
+    assert await list_all(session, 2, summary=True) == ids[::-1]
+
+
+async def test_list_scenes_by_status(session, make_scene):
+    ids = await create_scenes(session, make_scene, 4)
+    for scene_id in ids[:2]:
+        scene = await db.get_scene(session, scene_id)
+        db.mark_scene(scene, SCENE_EDITED)
+    await session.commit()
+
+    assert await list_all(session, 1, status=SCENE_EDITED) == ids[1::-1]
+
+
+async def test_scenes_advancing_during_a_listing_keep_their_place(session, make_scene):
+    ids = await create_scenes(session, make_scene, 6)
+
+    first = [s.id for s in await db.list_scenes(session, 3)]
+    cursor = db.encode_cursor(await db.get_scene(session, first[-1]))
+    # the pipeline moves every scene along before the next page is read
+    for scene_id in ids:
+        scene = await db.get_scene(session, scene_id)
+        db.mark_scene(scene, SCENE_PROMPTED)
+    await session.commit()
+    second = await db.list_scenes(session, 3, db.decode_cursor(cursor))
+
+    assert first + [s.id for s in second] == ids[::-1]
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        db.decode_cursor("not a cursor")
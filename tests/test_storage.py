@@ -0,0 +1,231 @@
+import json
+import os
+import typing as T
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from gcloud.aio.storage import Storage
+
+import s3
+from s3 import S3Storage
+
+pytestmark = pytest.mark.anyio
+
+MIB = 1024 * 1024
+
+
+@pytest.fixture
+def service_file(tmp_path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    path = tmp_path / "service.json"
+    path.write_text(
+        json.dumps(
+            {
+                "type": "service_account",
+                "project_id": "test",
+                "client_email": "signer@test.iam.gserviceaccount.com",
+                "private_key": pem.decode(),
+                "token_uri": "https://oauth2.googleapis.com/token",
+            }
+        )
+    )
+    return str(path)
+
+
+@pytest.fixture
+async def storage(service_file):
+    storage = S3Storage("bucket", url_cache_size=16)
+    storage._client = Storage(service_file=service_file)
+    yield storage
+    await storage.close()
+
+
+async def test_get_presigned_url_signs_locally(storage):
+    url = await storage.get_presigned_url("gs://bucket/some/object", 300)
+
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    assert parsed.path == "/bucket/some/object"
+    assert query["X-Goog-Expires"] == ["300"]
+    assert query["X-Goog-Credential"][0].startswith("signer@test")
+    assert query["X-Goog-Signature"]
+
+
+async def test_get_presigned_url_is_cached(storage):
+    first = await storage.get_presigned_url("gs://bucket/object", 300)
+    second = await storage.get_presigned_url("gs://bucket/object", 300)
+
+    assert first == second
+    assert storage.url_cache.stats()["hits"] == 1
+
+
+class FakeGCS(object):
+    """
+    The resumable upload endpoints of gcs. Each PUT answer can be replaced,
+    and `keep` limits how many bytes of each chunk are stored.
+    """
+
+    def __init__(self):
+        self.objects: dict = {}
+        self.failures: list = []
+        self.keep: T.Optional[int] = None
+        self.requests: list = []
+        self.cancelled: list = []
+        self.uploads = 0
+        self.app = web.Application()
+        self.app.router.add_get("/storage/v1/b/{bucket}/o/{name}", self.metadata)
+        self.app.router.add_post("/upload/storage/v1/b/{bucket}/o", self.start)
+        self.app.router.add_put("/session/{name}", self.put)
+        self.app.router.add_delete("/session/{name}", self.cancel)
+
+    async def metadata(self, request):
+        name = request.match_info["name"]
+        if name not in self.objects:
+            return web.Response(status=404)
+        return web.json_response({"name": name, "size": len(self.objects[name])})
+
+    async def start(self, request):
+        name = request.query["name"]
+        if request.query.get("ifGenerationMatch") == "0" and name in self.objects:
+            return web.Response(status=412)
+        if request.query["uploadType"] == "media":
+            self.objects[name] = bytearray(await request.read())
+            self.uploads += 1
+            return web.json_response({"name": name})
+
+        self.objects[name] = bytearray()
+        url = request.url.with_path(f"/session/{name}").with_query({})
+        return web.Response(headers={"Location": str(url)})
+
+    async def put(self, request):
+        name = request.match_info["name"]
+        data = await request.read()
+        self.requests.append(request.headers["Content-Range"])
+        if self.failures:
+            return web.Response(status=self.failures.pop(0))
+
+        stored = self.objects[name]
+        unit, _, spec = request.headers["Content-Range"].partition(" ")
+        span, _, total = spec.partition("/")
+        if span != "*":
+            start = int(span.partition("-")[0])
+            assert start == len(stored)
+            stored += data[: self.keep] if total == "*" and self.keep else data
+
+        if total != "*" and len(stored) == int(total):
+            return web.json_response({"name": name})
+        headers = {"Range": f"bytes=0-{len(stored) - 1}"} if stored else {}
+        return web.Response(status=308, headers=headers)
+
+    async def cancel(self, request):
+        self.cancelled.append(request.match_info["name"])
+        return web.Response(status=499)
+
+
+@pytest.fixture
+async def gcs():
+    fake = FakeGCS()
+    server = TestServer(fake.app)
+    await server.start_server()
+    fake.url = str(server.make_url("")).rstrip("/")
+    yield fake
+    await server.close()
+
+
+@pytest.fixture
+async def gcs_storage(gcs):
+    storage = S3Storage("bucket", api_root=gcs.url)
+    yield storage
+    await storage.close()
+
+
+async def stream(data: bytes, piece: int = 100_000):
+    for i in range(0, len(data), piece):
+        yield data[i : i + piece]
+
+
+def stored(gcs, url: str) -> bytes:
+    return bytes(gcs.objects[url.rpartition("/")[2]])
+
+
+async def test_save_uploads_each_content_once(gcs, gcs_storage):
+    first = await gcs_storage.save(b"content")
+    second = await gcs_storage.save(b"content")
+
+    assert first == second
+    assert stored(gcs, first) == b"content"
+    assert gcs.uploads == 1
+
+
+async def test_save_accepts_a_concurrent_upload(gcs, gcs_storage, monkeypatch):
+    async def exists(obj_id):
+        return False
+
+    await gcs_storage.save(b"content")
+    monkeypatch.setattr(gcs_storage, "_exists", exists)
+
+    assert await gcs_storage.save(b"content")
+    assert gcs.uploads == 1
+
+
+@pytest.mark.parametrize("size", [10, 256 * 1024, 256 * 1024 + 1, 3 * MIB + 5])
+async def test_save_stream(gcs, gcs_storage, size):
+    data = os.urandom(size)
+
+    url = await gcs_storage.save_stream(stream(data), chunk_size=MIB)
+
+    assert stored(gcs, url) == data
+
+
+async def test_save_stream_resumes_from_the_stored_range(gcs, gcs_storage):
+    data = os.urandom(3 * MIB)
+    gcs.keep = 256 * 1024
+
+    url = await gcs_storage.save_stream(stream(data), chunk_size=MIB)
+
+    assert stored(gcs, url) == data
+
+
+async def test_save_stream_retries_a_failed_chunk(gcs, gcs_storage, monkeypatch):
+    monkeypatch.setattr(s3.asyncio, "sleep", _no_sleep)
+    data = os.urandom(2 * MIB)
+    gcs.failures = [503, 503]
+
+    url = await gcs_storage.save_stream(stream(data), chunk_size=MIB)
+
+    assert stored(gcs, url) == data
+    # the failures are followed by a query of the stored range
+    assert "bytes */*" in gcs.requests
+
+
+async def test_save_stream_gives_up_on_client_errors(gcs, gcs_storage):
+    gcs.failures = [404]
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        await gcs_storage.save_stream(stream(os.urandom(10)))
+    assert len(gcs.cancelled) == 1
+
+
+async def test_save_stream_caps_the_size(gcs, gcs_storage):
+    with pytest.raises(s3.UploadTooLarge):
+        await gcs_storage.save_stream(stream(os.urandom(MIB)), max_size=MIB - 1)
+    assert len(gcs.cancelled) == 1
+
+
+async def test_save_stream_refuses_empty_content(gcs, gcs_storage):
+    with pytest.raises(ValueError):
+        await gcs_storage.save_stream(stream(b""))
+
+
+async def _no_sleep(delay):
+    pass
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import db
+from models.db import (
+    JOB_PENDING,
+    SCENE_DESCRIBED,
+    SCENE_EDITED,
+    SCENE_FAILED,
+    SCENE_PENDING,
+    Job,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_interrupted_scenes_are_queued_once(session, make_scene):
+    ids = {}
+    for status in (SCENE_PENDING, SCENE_DESCRIBED, SCENE_EDITED, SCENE_FAILED):
+        scene = make_scene(status=status)
+        await db.create_scene(session, scene)
+        ids[status] = scene.id
+
+    assert await db.enqueue_interrupted_scenes(session) == [
+        ids[SCENE_PENDING],
+        ids[SCENE_DESCRIBED],
+    ]
+    assert await db.enqueue_interrupted_scenes(session) == []
+
+
+async def test_scenes_with_an_active_job_are_skipped(session, make_scene):
+    await db.create_scene_job(session, make_scene())
+
+    assert await db.enqueue_interrupted_scenes(session) == []
+
+    job = await db.claim_job(session, "w1", 600, 1)
+    scene_id = job.scene_id
+    assert await db.enqueue_interrupted_scenes(session) == []
+
+    await session.refresh(job)
+    await db.fail_job(session, job, "boom", 1)
+    assert await db.enqueue_interrupted_scenes(session) == [scene_id]
+
+
+async def test_concurrent_sweeps_queue_each_scene_once(session, make_scene):
+    for _ in range(5):
+        await db.create_scene(session, make_scene())
+
+    async def sweep():
+        async with db.SessionLocal() as s:
+            return await db.enqueue_interrupted_scenes(s)
+
+    results = await asyncio.gather(*[sweep() for _ in range(4)])
+
+    queued = sum(results, [])
+    assert len(queued) == len(set(queued)) == 5
+    assert (await db.count_jobs(session))[JOB_PENDING] == 5
+
+
+async def test_a_scene_has_one_active_job(session, make_scene):
+    job = await db.create_scene_job(session, make_scene())
+    scene_id = job.scene_id
+
+    session.add(
+        Job(
+            scene_id=scene_id,
+            status=JOB_PENDING,
+            attempts=0,
+            created_at=job.created_at,
+        )
+    )
+    with pytest.raises(IntegrityError):
+        await session.commit()
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+import db
+import worker as worker_module
+from core import tracing
+from worker import Worker
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(scope="module")
+def spans():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(tracing.SceneSpanProcessor())
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return exporter
+
+
+def finished(spans, name: str) -> list:
+    return [span for span in spans.get_finished_spans() if span.name == name]
+
+
+async def test_job_span_continues_the_request_trace(
+    session, make_scene, monkeypatch, spans
+):
+    async def pipeline(scene, final):
+        with tracing.tracer.start_as_current_span("step"):
+            pass
+
+    monkeypatch.setattr(worker_module, "pipeline", pipeline)
+    scene = make_scene()
+    with tracing.tracer.start_as_current_span("request") as request:
+        await db.create_scene_job(session, scene, tracing.inject())
+
+    worker = Worker(1, 0.1, 600, 3)
+    job = await worker._claim()
+    await worker._process(job.id, asyncio.Semaphore(0))
+
+    (span,) = finished(spans, "job")
+    assert span.context.trace_id == request.get_span_context().trace_id
+    assert span.parent.span_id == request.get_span_context().span_id
+    assert span.attributes["scene.id"] == str(scene.id)
+    assert span.attributes["job.id"] == job.id
+    # spans started by the pipeline carry the scene id too
+    (step,) = finished(spans, "step")
+    assert step.parent.span_id == span.context.span_id
+    assert step.attributes["scene.id"] == str(scene.id)
+
+
+def test_file_exporter_closes_its_file(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.FileSpanExporter(str(path))
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    provider.get_tracer("test").start_span("probe").end()
+
+    provider.shutdown()
+
+    assert exporter.out.closed
+    (line,) = path.read_text().splitlines()
+    assert json.loads(line)["name"] == "probe"
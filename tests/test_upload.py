@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from api.routes.scene import _spool
+from s3 import UploadTooLarge
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunks(*pieces, error: Exception | None = None):
+    for piece in pieces:
+        yield piece
+    if error is not None:
+        raise error
+
+
+def spooled(tmp_path) -> list:
+    return list(tmp_path.glob("upload-*"))
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+
+async def test_spool(tmp_path):
+    path = await _spool(chunks(b"ab", b"cd"))
+
+    with open(path, "rb") as f:
+        assert f.read() == b"abcd"
+    os.remove(path)
+
+
+async def test_spool_removes_the_file_on_error(tmp_path):
+    with pytest.raises(ConnectionResetError):
+        await _spool(chunks(b"ab", error=ConnectionResetError()))
+
+    assert spooled(tmp_path) == []
+
+
+async def test_spool_caps_the_size(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        await _spool(chunks(b"ab", b"cd"), max_size=3)
+
+    assert spooled(tmp_path) == []
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import db
+import worker as worker_module
+from models.db import JOB_DONE, JOB_PENDING
+from pipeline import DuplicateInFlight
+from worker import Worker
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def run_job(session, make_scene, monkeypatch):
+    async def run(pipeline, visibility_timeout=600) -> int:
+        await db.create_scene_job(session, make_scene())
+        monkeypatch.setattr(worker_module, "pipeline", pipeline)
+
+        worker = Worker(1, 0.1, visibility_timeout, 3, retry_backoff=10)
+        job = await worker._claim()
+        await worker._process(job.id, asyncio.Semaphore(0))
+        return job.id
+
+    return run
+
+
+async def test_process_completes_the_job(session, run_job):
+    async def pipeline(scene, final):
+        pass
+
+    job_id = await run_job(pipeline)
+
+    job = await db.get_job(session, job_id)
+    assert job.status == JOB_DONE
+
+
+async def test_process_backs_off_a_failed_attempt(session, run_job):
+    async def pipeline(scene, final):
+        raise RuntimeError("boom")
+
+    job_id = await run_job(pipeline)
+
+    job = await db.get_job(session, job_id)
+    assert job.status == JOB_PENDING
+    assert job.error == "boom"
+    assert job.not_before > datetime.now()
+
+
+async def test_heartbeat_runs_while_the_pipeline_does(run_job, monkeypatch):
+    beats = []
+
+    async def heartbeat_job(session, job_id, worker):
+        beats.append(job_id)
+        return True
+
+    async def pipeline(scene, final):
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(db, "heartbeat_job", heartbeat_job)
+
+    job_id = await run_job(pipeline, visibility_timeout=0.03)
+
+    assert beats and set(beats) == {job_id}
+
+
+async def test_process_releases_a_duplicate_in_flight(session, run_job):
+    async def pipeline(scene, final):
+        raise DuplicateInFlight(1, 10)
+
+    job_id = await run_job(pipeline)
+
+    job = await db.get_job(session, job_id)
+    assert job.status == JOB_PENDING
+    assert job.attempts == 0
+    assert job.not_before > datetime.now()
+
+
+async def test_only_the_last_attempt_is_final(session, make_scene, monkeypatch):
+    finals = []
+
+    async def pipeline(scene, final):
+        finals.append(final)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(worker_module, "pipeline", pipeline)
+    await db.create_scene_job(session, make_scene())
+    worker = Worker(1, 0.1, 600, 3)
+    while job := await worker._claim():
+        await worker._process(job.id, asyncio.Semaphore(0))
+
+    assert finals == [False, False, True]